@@ -0,0 +1,143 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from dury.metrics import Metrics, default_metrics
+from dury.store import ContentStore
+from dury.utils import (
+    DEFAULT_HEADER, DEFAULT_CHUNK_SIZE, get_expected_size,
+    resume_state, resume_headers, save_resume_state, clear_resume_state
+)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+async def download_async(
+    session: "aiohttp.ClientSession",
+    url: str,
+    output_path: str, *,
+    headers: Optional[Dict[str, str]] = DEFAULT_HEADER,
+    timeout: Optional[float] = None,
+    retry: Optional[int] = 5,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    store: Optional[ContentStore] = None,
+    metrics: Optional[Metrics] = None
+) -> str:
+    metrics = metrics or default_metrics
+    if store is not None:
+        digest = store.lookup(url)
+        if digest is not None:
+            metrics.inc("download_store_hits")
+            return store.materialize(digest, output_path, url=url)
+
+    part_path = f"{output_path}.part"
+
+    for remaining in range(retry, -1, -1):
+        started = time.monotonic()
+        try:
+            hasher = await asyncio.wait_for(
+                _fetch_to_part(
+                    session, url, part_path,
+                    headers=headers, chunk_size=chunk_size, store=store, metrics=metrics
+                ),
+                timeout
+            )
+            metrics.observe("download", time.monotonic() - started)
+            if store is not None:
+                digest = hasher.hexdigest()
+                store.put(part_path, digest, url=url)
+                clear_resume_state(part_path)
+                return store.materialize(digest, output_path, url=url)
+
+            os.replace(part_path, output_path)
+            clear_resume_state(part_path)
+            return output_path
+        except (aiohttp.ClientError, asyncio.TimeoutError, IOError) as e:
+            if remaining == 0:
+                metrics.inc("download_failures")
+                raise IOError("Failed to download") from e
+            metrics.inc("download_retries")
+
+
+async def _fetch_to_part(
+    session: "aiohttp.ClientSession",
+    url: str,
+    part_path: str, *,
+    headers: Optional[Dict[str, str]] = None,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    store: Optional[ContentStore] = None,
+    metrics: Optional[Metrics] = None
+):
+    offset, validator = resume_state(part_path, url)
+    request_headers = resume_headers(headers, offset, validator)
+
+    async with session.get(url, headers=request_headers) as res:
+        metrics.inc("download_status", code=res.status)
+        if res.status == 416:
+            os.remove(part_path)
+            raise IOError(f"Invalid range for {url}")
+        if res.status not in (200, 206):
+            raise IOError(f"Unexpected status code {res.status} for {url}")
+
+        if res.status == 200:
+            offset = 0
+            save_resume_state(part_path, url, res.headers)
+
+        expected_size = get_expected_size(res.headers, offset)
+
+        hasher = None
+        if store is not None:
+            hasher = store.hash_file(part_path) if offset > 0 else store.hasher()
+
+        with open(part_path, "ab" if offset > 0 else "wb") as f:
+            async for chunk in res.content.iter_chunked(chunk_size):
+                f.write(chunk)
+                metrics.inc("download_bytes", len(chunk))
+                if hasher is not None:
+                    hasher.update(chunk)
+
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size != expected_size:
+        raise IOError(f"Incomplete download for {url} ({size}/{expected_size} bytes)")
+    return hasher
+
+
+async def download_all_async(
+    tasks: List[Tuple[str, str]], *,
+    num_workers: Optional[int] = 100,
+    headers: Optional[Dict[str, str]] = DEFAULT_HEADER,
+    timeout: Optional[float] = None,
+    retry: Optional[int] = 5,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    store: Optional[ContentStore] = None,
+    metrics: Optional[Metrics] = None
+) -> List[str]:
+    if aiohttp is None:
+        raise ImportError("aiohttp is required for the asyncio download engine, install dury[asyncio]")
+
+    semaphore = asyncio.Semaphore(num_workers)
+    connector = aiohttp.TCPConnector(limit=num_workers)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+        with tqdm(total=len(tasks)) as progress:
+            async def run(url: str, output_path: str) -> str:
+                async with semaphore:
+                    result = await download_async(
+                        session, url, output_path,
+                        headers=headers, timeout=timeout,
+                        retry=retry, chunk_size=chunk_size, store=store, metrics=metrics
+                    )
+                progress.update(1)
+                return result
+
+            return await asyncio.gather(*(run(url, output_path) for url, output_path in tasks))
+
+
+def download_all(tasks: List[Tuple[str, str]], **kwargs) -> List[str]:
+    return asyncio.run(download_all_async(tasks, **kwargs))
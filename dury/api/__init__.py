@@ -1,2 +1,4 @@
 from .twitch import TwitchClient
 from .youtube import YouTubeClient
+from .cache import ResponseCache
+from .ratelimit import RateLimiter
@@ -1,33 +1,145 @@
-import requests
+import time
 from typing import Optional, Dict, Any
 
+from .cache import ResponseCache, CacheEntry
+from .ratelimit import RateLimiter
+from dury.metrics import Metrics, default_metrics
+from dury.session import SessionPool
+
 
 class APIWrapper:
+    # Seconds a response stays fresh, by endpoint path
+    CACHE_TTL: Dict[str, float] = {}
+
     def __init__(
         self,
         base_url: str, *,
-        headers: Optional[Dict[str, Any]] = None
+        headers: Optional[Dict[str, Any]] = None,
+        session_pool: Optional[SessionPool] = None,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        metrics: Optional[Metrics] = None
     ) -> None:
         self._base_url = base_url
         self._headers = headers
+        self._cache = cache
+        self._rate_limiter = rate_limiter
+        self._metrics = metrics if metrics is not None else default_metrics
+
+        # Only close the pool on exit when it is not shared with other clients
+        self._owns_session_pool = session_pool is None
+        self._session_pool = session_pool if session_pool is not None else SessionPool()
 
     def _get(
         self,
         path: str, *,
         params: Optional[Dict[str, Any]] = None
     ):
-        res = requests.get(
-            f"{self._base_url}/{path}",
-            params=params,
-            headers=self._headers
-        )
-        return res.json()
+        url = f"{self._base_url}/{path}"
+        headers = dict(self._headers or {})
+
+        entry = None
+        if self._cache is not None:
+            key = self._cache.key(url, params)
+            entry = self._cache.get(key)
+            if entry is not None and entry.fresh:
+                self._cache.record("hits")
+                return entry.body
+            self._cache.record("misses")
+            if entry is not None and entry.etag is not None:
+                headers["If-None-Match"] = entry.etag
+
+        res = self._request(url, params=params, headers=headers)
+
+        if self._cache is None:
+            return res.json()
+
+        ttl = self._cache.ttl_for(path, self.CACHE_TTL.get(path))
+        if res.status_code == 304 and entry is not None:
+            self._cache.record("revalidated")
+            self._cache.set(key, CacheEntry(entry.body, entry.etag, time.time() + ttl))
+            return entry.body
+
+        body = res.json()
+        etag = res.headers.get("ETag")
+        if res.status_code == 200 and (ttl > 0 or etag is not None):
+            self._cache.set(key, CacheEntry(body, etag, time.time() + ttl))
+        return body
+
+    def _request(
+        self,
+        url: str, *,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, Any]] = None
+    ):
+        res = self._send(url, params=params, headers=headers)
+        if res.status_code == 401 and self._refresh_auth():
+            res = self._send(url, params=params, headers=headers)
+        return res
+
+    def _send(
+        self,
+        url: str, *,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, Any]] = None
+    ):
+        session = self._session_pool.get(self._base_url)
+        if self._rate_limiter is None:
+            return self._timed_get(session, url, params=params, headers=headers)
+
+        # Requests over the budget are queued until the bucket refills instead of failing
+        while True:
+            self._rate_limiter.acquire()
+            res = self._timed_get(session, url, params=params, headers=headers)
+            if res.status_code != 429:
+                self._rate_limiter.update(res.headers)
+                return res
+            self._rate_limiter.reject(res.headers)
+
+    def _timed_get(
+        self,
+        session,
+        url: str, *,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, Any]] = None
+    ):
+        endpoint = url[len(self._base_url):].strip("/")
+        with self._metrics.timer("api_request", endpoint=endpoint):
+            res = session.get(url, params=params, headers={ **self._auth_headers(), **(headers or {}) })
+        self._metrics.inc("api_status", endpoint=endpoint, code=res.status_code)
+        return res
+
+    def _auth_headers(self) -> Dict[str, Any]:
+        return {}
+
+    def _refresh_auth(self) -> bool:
+        return False
 
     def _post(self):
         ...
 
     def _put(self):
         ...
-    
+
     def _delete(self):
-        ...
\ No newline at end of file
+        ...
+
+    def cache_stats(self) -> Dict[str, int]:
+        if self._cache is None:
+            return {}
+        return self._cache.stats()
+
+    def rate_limit_stats(self) -> Dict[str, Any]:
+        if self._rate_limiter is None:
+            return {}
+        return self._rate_limiter.stats()
+
+    def close(self) -> None:
+        if self._owns_session_pool:
+            self._session_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any
+
+
+@dataclass
+class CacheEntry:
+    body: Any
+    etag: Optional[str] = None
+    expires_at: Optional[float] = 0.0
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+
+class MemoryCache:
+    def __init__(self, *, max_size: Optional[int] = 1024) -> None:
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, body TEXT NOT NULL, etag TEXT, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(json.loads(row[0]), row[1], row[2])
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, body, etag, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(entry.body), entry.etag, entry.expires_at)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    def __init__(
+        self, *,
+        max_size: Optional[int] = 1024,
+        path: Optional[str] = None,
+        ttl: Optional[Dict[str, float]] = None,
+        default_ttl: Optional[float] = 0.0
+    ) -> None:
+        self.ttl = ttl or {}
+        self.default_ttl = default_ttl
+        self._memory = MemoryCache(max_size=max_size)
+        self._disk = SQLiteCache(path) if path is not None else None
+
+        self._stats = { "hits": 0, "misses": 0, "revalidated": 0, "stores": 0 }
+        self._stats_lock = threading.Lock()
+
+    def key(self, url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        # Keys are hashed so credentials in query parameters never reach the disk
+        items = sorted((k, v) for k, v in (params or {}).items() if v is not None)
+        raw = json.dumps([url, items], ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, path: str, default: Optional[float] = None) -> float:
+        if path in self.ttl:
+            return self.ttl[path]
+        return default if default is not None else self.default_ttl
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._memory.get(key)
+        if entry is None and self._disk is not None:
+            entry = self._disk.get(key)
+            if entry is not None:
+                self._memory.set(key, entry)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry) -> None:
+        self._memory.set(key, entry)
+        if self._disk is not None:
+            self._disk.set(key, entry)
+        self.record("stores")
+
+    def record(self, name: str) -> None:
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def clear(self) -> None:
+        self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
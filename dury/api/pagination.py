@@ -0,0 +1,70 @@
+import threading
+from queue import Queue, Full
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+_DONE = object()
+
+
+def paginate(
+    fetch: Callable[[Optional[str]], Dict[str, Any]], *,
+    items_key: str,
+    next_cursor: Callable[[Dict[str, Any]], Optional[str]],
+    max_items: Optional[int] = None,
+    buffer_size: Optional[int] = 2
+) -> Iterator[Any]:
+    # Pages are fetched by a background thread into a bounded queue, so the
+    # next page is already on its way while the current one is consumed.
+    pages: Queue = Queue(maxsize=buffer_size)
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce() -> None:
+        cursor = None
+        fetched = 0
+        try:
+            while not stop.is_set():
+                page = fetch(cursor)
+                items = page.get(items_key, [])
+                if not put(items):
+                    return
+
+                fetched += len(items)
+                cursor = next_cursor(page)
+                if not items or not cursor or (max_items is not None and fetched >= max_items):
+                    break
+        except Exception as e:
+            put(e)
+            return
+        put(_DONE)
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+
+    count = 0
+    try:
+        while True:
+            items = pages.get()
+            if items is _DONE:
+                return
+            if isinstance(items, Exception):
+                raise items
+
+            for item in items:
+                if max_items is not None and count >= max_items:
+                    return
+                yield item
+                count += 1
+
+            if max_items is not None and count >= max_items:
+                return
+    finally:
+        stop.set()
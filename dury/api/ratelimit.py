@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class RateLimiter:
+    def __init__(
+        self, *,
+        capacity: Optional[int] = 800,
+        period: Optional[float] = 60.0,
+        state_file: Optional[str] = None
+    ) -> None:
+        # state_file shares the bucket between processes through an flock'd file
+        assert state_file is None or fcntl is not None, "state_file requires fcntl"
+
+        self.state_file = state_file
+        self.period = period
+        self._lock = threading.Lock()
+        self._state = {
+            "capacity": capacity,
+            "tokens": float(capacity),
+            "rate": capacity / period,
+            "updated": time.time(),
+            "blocked_until": 0.0
+        }
+        self._stats = {
+            "requests": 0,
+            "throttled_requests": 0,
+            "throttled_seconds": 0.0,
+            "rejected": 0
+        }
+
+    @contextmanager
+    def _locked_state(self) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            if self.state_file is None:
+                yield self._state
+                return
+
+            fd = os.open(self.state_file, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                with os.fdopen(fd, "r+", closefd=False) as f:
+                    raw = f.read()
+                    state = json.loads(raw) if raw else dict(self._state)
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    self._state = dict(state)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _refill(self, state: Dict[str, Any], now: float) -> None:
+        elapsed = max(now - state["updated"], 0.0)
+        state["tokens"] = min(state["capacity"], state["tokens"] + elapsed * state["rate"])
+        state["updated"] = now
+
+    def acquire(self) -> float:
+        waited = 0.0
+        while True:
+            with self._locked_state() as state:
+                now = time.time()
+                self._refill(state, now)
+                if now < state.get("blocked_until", 0.0):
+                    delay = state["blocked_until"] - now
+                elif state["tokens"] >= 1:
+                    state["tokens"] -= 1
+                    break
+                else:
+                    delay = (1 - state["tokens"]) / state["rate"]
+
+            time.sleep(delay)
+            waited += delay
+
+        with self._lock:
+            self._stats["requests"] += 1
+            if waited > 0:
+                self._stats["throttled_requests"] += 1
+                self._stats["throttled_seconds"] += waited
+        return waited
+
+    def update(self, headers: Dict[str, str]) -> None:
+        limit = headers.get("Ratelimit-Limit")
+        remaining = headers.get("Ratelimit-Remaining")
+        if remaining is None:
+            return
+
+        with self._locked_state() as state:
+            self._refill(state, time.time())
+            if limit is not None:
+                state["capacity"] = int(limit)
+                state["rate"] = int(limit) / self.period
+            # Requests still in flight were already taken from the local bucket
+            state["tokens"] = min(state["tokens"], float(remaining))
+
+    def reject(self, headers: Dict[str, str]) -> None:
+        reset = headers.get("Ratelimit-Reset")
+        now = time.time()
+        with self._locked_state() as state:
+            state["tokens"] = 0.0
+            state["updated"] = now
+            if reset is not None:
+                state["blocked_until"] = max(state.get("blocked_until", 0.0), float(reset))
+
+        with self._lock:
+            self._stats["rejected"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
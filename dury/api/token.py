@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+DEFAULT_TOKEN_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "dury", "tokens.json")
+
+
+class TokenCache:
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_TOKEN_CACHE, *,
+        refresh_margin: Optional[float] = 300.0
+    ) -> None:
+        self.path = path
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+
+    def valid(self, token: Optional[Dict[str, Any]]) -> bool:
+        return token is not None and time.time() < token["expires_at"] - self.refresh_margin
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            token = self._read().get(key)
+            return token if self.valid(token) else None
+
+    def set(self, key: str, token: Dict[str, Any]) -> None:
+        with self._lock:
+            tokens = self._read()
+            tokens[key] = token
+            self._write(tokens)
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        # Serialize token fetches across threads and processes so that a fleet
+        # of workers starting together requests a single token
+        with self._lock:
+            if self.path is None or fcntl is None:
+                yield
+                return
+
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        if self.path is None or not os.path.exists(self.path):
+            return dict(self._tokens)
+        with open(self.path, "r") as f:
+            try:
+                return json.load(f)
+            except ValueError:
+                return {}
+
+    def _write(self, tokens: Dict[str, Dict[str, Any]]) -> None:
+        if self.path is None:
+            self._tokens = tokens
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(tokens, f)
+        os.replace(tmp_path, self.path)
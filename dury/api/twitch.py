@@ -1,16 +1,21 @@
-import requests
 import re
 import os
 import time
-from concurrent.futures import ThreadPoolExecutor
+import threading
 import shutil
-from typing import List, Optional, Union, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union, Dict, Any, Iterator
 
-from tqdm import tqdm
 from loguru import logger
+from tqdm import tqdm
 
 from .base import APIWrapper
-from dury.utils import download
+from .cache import ResponseCache
+from .pagination import paginate
+from .ratelimit import RateLimiter
+from .token import TokenCache
+from dury.session import SessionPool
+from dury.utils import download_many, fetch, append_file, OrderedWriter
 
 
 class TwitchClient(APIWrapper):
@@ -18,28 +23,82 @@ class TwitchClient(APIWrapper):
     OAUTH_URL = "https://id.twitch.tv/oauth2/token"
     PLAYLISTS_URL = "https://usher.ttvnw.net/vod/{}"
     PRIVATE_API_URL = "https://gql.twitch.tv/gql"
+    MAX_IDS_PER_REQUEST = 100
+    CACHE_TTL = {
+        "games": 24 * 60 * 60,
+        "chat/badges": 60 * 60,
+        "chat/emotes": 60 * 60,
+        "teams": 60 * 60,
+        "teams/channel": 60 * 60
+    }
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str, *,
+        session_pool: Optional[SessionPool] = None,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        token_cache: Optional[TokenCache] = None,
+        batch_concurrency: Optional[int] = 4
+    ) -> None:
+        super(TwitchClient, self).__init__(
+            self.PUBLIC_API_URL,
+            session_pool=session_pool,
+            cache=cache,
+            rate_limiter=rate_limiter if rate_limiter is not None else RateLimiter()
+        )
 
-    def __init__(self, client_id: str, client_secret: str) -> None:
+        self.batch_concurrency = batch_concurrency
         self.__client_id = client_id
         self.__client_secret = client_secret
-        self.__oauth = self.get_oauth(self.__client_id, self.__client_secret)
 
-        super(TwitchClient, self).__init__(
-            self.PUBLIC_API_URL,
-            headers={
-                "Client-Id": self.__client_id,
-                "Authorization": self.__oauth
-            }
-        )
+        # The app token is fetched lazily on the first call and shared through the cache
+        self._token_cache = token_cache if token_cache is not None else TokenCache()
+        self._token = None
+        self._token_lock = threading.Lock()
 
     def get_oauth(self, client_id: str, client_secret: str):
-        res = requests.post(self.OAUTH_URL, params={
+        oauth = self._fetch_token(client_id, client_secret)
+        return f"{oauth['token_type'].capitalize()} {oauth['access_token']}"
+
+    def _fetch_token(self, client_id: str, client_secret: str) -> Dict[str, Any]:
+        session = self._session_pool.get(self.OAUTH_URL)
+        res = session.post(self.OAUTH_URL, params={
             "client_id": client_id,
             "client_secret": client_secret,
             "grant_type": "client_credentials"
         })
         oauth = res.json()
-        return f"{oauth['token_type'].capitalize()} {oauth['access_token']}"
+        return {
+            "access_token": oauth["access_token"],
+            "token_type": oauth["token_type"],
+            "expires_at": time.time() + oauth.get("expires_in", 0)
+        }
+
+    def _auth_headers(self) -> Dict[str, Any]:
+        with self._token_lock:
+            if not self._token_cache.valid(self._token):
+                self._token = self._load_token()
+            token = self._token
+        return {
+            "Client-Id": self.__client_id,
+            "Authorization": f"{token['token_type'].capitalize()} {token['access_token']}"
+        }
+
+    def _refresh_auth(self) -> bool:
+        with self._token_lock:
+            self._token = self._load_token(stale=self._token)
+        return True
+
+    def _load_token(self, stale: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        with self._token_cache.lock():
+            # Another worker may have refreshed the token while we waited for the lock
+            token = self._token_cache.get(self.__client_id)
+            if token is None or (stale is not None and token["access_token"] == stale["access_token"]):
+                token = self._fetch_token(self.__client_id, self.__client_secret)
+                self._token_cache.set(self.__client_id, token)
+            return token
 
     def get_users(
         self, *,
@@ -47,7 +106,7 @@ class TwitchClient(APIWrapper):
         login: Optional[Union[str, List[str]]] = None
     ):
         params = { "id": id, "login": login }
-        return self._get("users", params=params)
+        return self._get_batched("users", params, { "id": "id", "login": "login" })
 
     def get_user_follows(
         self, *,
@@ -64,7 +123,7 @@ class TwitchClient(APIWrapper):
 
     def get_channel_information(self, broadcaster_id: Union[str, List[str]]):
         params = { "broadcaster_id": broadcaster_id }
-        return self._get("channels", params=params)
+        return self._get_batched("channels", params, { "broadcaster_id": "broadcaster_id" })
 
     def get_channel_emotes(self, broadcaster_id: str):
         params = { "broadcaster_id": broadcaster_id }
@@ -98,7 +157,7 @@ class TwitchClient(APIWrapper):
 
     def get_games(self, game_id: Union[str, List[str]]):
         params = { "id": game_id }
-        return self._get("games", params=params)
+        return self._get_batched("games", params, { "id": "id" })
 
     def get_streams(
         self, *,
@@ -114,7 +173,10 @@ class TwitchClient(APIWrapper):
             "user_login": user_login, "first": first,
             "after": after, "before": before
         }
-        return self._get("streams", params=params)
+        return self._get_batched(
+            "streams", params,
+            { "user_id": "user_id", "user_login": "user_login" }
+        )
 
     def get_all_stream_tags(
         self, *,
@@ -130,8 +192,13 @@ class TwitchClient(APIWrapper):
         return self._get("streams/tags", params=params)
 
     def get_channel_teams(self, broadcaster_id: Union[str, List[str]]):
+        # This endpoint only takes a single broadcaster per request
         params = { "broadcaster_id": broadcaster_id }
-        return self._get("teams/channel", params=params)
+        return self._get_batched(
+            "teams/channel", params,
+            { "broadcaster_id": "broadcaster_id" },
+            batch_size=1
+        )
 
     def get_teams(
         self, *,
@@ -154,6 +221,93 @@ class TwitchClient(APIWrapper):
         }
         return self._get("videos", params=params)
 
+    def iter_user_follows(self, *, max_items: Optional[int] = None, buffer_size: Optional[int] = 2, **kwargs):
+        return self._paginate(self.get_user_follows, kwargs, max_items=max_items, buffer_size=buffer_size)
+
+    def iter_clips(self, broadcaster_id: str, *, max_items: Optional[int] = None, buffer_size: Optional[int] = 2, **kwargs):
+        kwargs["broadcaster_id"] = broadcaster_id
+        return self._paginate(self.get_clips, kwargs, max_items=max_items, buffer_size=buffer_size)
+
+    def iter_streams(self, *, max_items: Optional[int] = None, buffer_size: Optional[int] = 2, **kwargs):
+        return self._paginate(self.get_streams, kwargs, max_items=max_items, buffer_size=buffer_size)
+
+    def iter_videos(self, user_id: str, *, max_items: Optional[int] = None, buffer_size: Optional[int] = 2, **kwargs):
+        kwargs["user_id"] = user_id
+        return self._paginate(self.get_videos, kwargs, max_items=max_items, buffer_size=buffer_size)
+
+    def _paginate(
+        self,
+        method: Any,
+        kwargs: Dict[str, Any], *,
+        max_items: Optional[int] = None,
+        buffer_size: Optional[int] = 2
+    ) -> Iterator[Dict[str, Any]]:
+        kwargs.setdefault("first", 100)
+        return paginate(
+            lambda cursor: method(after=cursor, **kwargs),
+            items_key="data",
+            next_cursor=lambda page: page.get("pagination", {}).get("cursor"),
+            max_items=max_items,
+            buffer_size=buffer_size
+        )
+
+    def _get_batched(
+        self,
+        path: str,
+        params: Dict[str, Any],
+        batch_keys: Dict[str, str], *,
+        batch_size: Optional[int] = MAX_IDS_PER_REQUEST
+    ) -> Dict[str, Any]:
+        # Helix caps the number of ids and logins combined in a single request,
+        # so long lists are split into chunks which are fetched concurrently.
+        values = []
+        for key in batch_keys:
+            value = params.get(key)
+            if value is None:
+                continue
+            for v in ([value] if isinstance(value, str) else value):
+                values.append((key, str(v)))
+
+        if len(values) <= batch_size:
+            return self._get(path, params=params)
+
+        chunks = [ values[i:i + batch_size] for i in range(0, len(values), batch_size) ]
+        base_params = { k: v for k, v in params.items() if k not in batch_keys }
+        if "first" in base_params:
+            base_params["first"] = self.MAX_IDS_PER_REQUEST
+
+        def task(chunk):
+            chunk_params = dict(base_params)
+            for key, value in chunk:
+                chunk_params.setdefault(key, []).append(value)
+            body = self._get(path, params=chunk_params)
+            if "data" not in body:
+                return body
+            data = body["data"]
+
+            # Restore input order, items without a matching key go to the end
+            positions = {}
+            for i, (key, value) in enumerate(chunk):
+                positions.setdefault((batch_keys[key], value.lower()), i)
+            rank = lambda item: min(
+                [
+                    positions[(field, str(item.get(field, "")).lower())]
+                    for field in set(batch_keys.values())
+                    if (field, str(item.get(field, "")).lower()) in positions
+                ] or [len(chunk)]
+            )
+            return sorted(data, key=rank)
+
+        with ThreadPoolExecutor(max_workers=self.batch_concurrency) as executor:
+            results = list(executor.map(task, chunks))
+
+        # A chunk that failed is returned as is, the same as an unbatched
+        # request would, rather than merged into a silently partial result
+        for result in results:
+            if isinstance(result, dict):
+                return result
+        return { "data": [ item for data in results for item in data ] }
+
     def download_video(
         self,
         video_id: str, *,
@@ -161,25 +315,56 @@ class TwitchClient(APIWrapper):
         output_dir: Optional[str] = "twitch/video",
         video_name: Optional[str] = None,
         num_workers: Optional[int] = 10,
-        retry: Optional[int] = 5
+        retry: Optional[int] = 5,
+        engine: Optional[str] = "thread",
+        assemble: Optional[str] = "merge",
+        buffer_size: Optional[int] = None
     ):
         assert bitrate in [
             '160p30', '360p30', '480p30', '720p30',
             '720p60', 'audio_only', 'chunked'
         ], "Invalid bitrate"
+        assert assemble in ["merge", "stream"], "Invalid assemble mode"
+        # Streamed segments are fetched by a thread pool in playlist order
+        assert assemble != "stream" or engine == "thread", "Streaming only supports the thread engine"
 
         access_token = self._get_access_token(video_id)["data"]["videoPlaybackAccessToken"]
         video_uri = self._get_video_uri(video_id, access_token, bitrate=bitrate)
         chunk_uris = self._get_chunk_uris(video_uri)
 
+        if assemble == "stream":
+            os.makedirs(output_dir, exist_ok=True)
+            if video_name is None:
+                video_name = video_id
+
+            video_path = os.path.join(output_dir, f"{video_name}_{bitrate}.mp4")
+            try:
+                return self._stream_chunks(
+                    chunk_uris, video_path,
+                    num_workers=num_workers,
+                    retry=retry,
+                    buffer_size=buffer_size or num_workers * 2
+                )
+            except Exception as e:
+                logger.error(e)
+                return None
+
         timestamp = int(time.time())
         tmp_dir = os.path.join("/tmp", "dury", str(timestamp))
         os.makedirs(tmp_dir, exist_ok=True)
-        task = lambda x: download(x[1], os.path.join(tmp_dir, f"{str(x[0]).zfill(8)}.ts"), retry=retry)
+        tasks = [
+            (chunk_uri, os.path.join(tmp_dir, f"{str(i).zfill(8)}.ts"))
+            for i, chunk_uri in enumerate(chunk_uris)
+        ]
 
         try:
-            with ThreadPoolExecutor(max_workers=num_workers) as executor:
-                results = list(tqdm(executor.map(task, enumerate(chunk_uris)), total=len(chunk_uris)))
+            results = download_many(
+                tasks,
+                engine=engine,
+                num_workers=num_workers,
+                retry=retry,
+                session_pool=self._session_pool
+            )
 
             os.makedirs(output_dir, exist_ok=True)
             if video_name is None:
@@ -197,10 +382,51 @@ class TwitchClient(APIWrapper):
     def _merge_chunks(self, chunk_list: List[str], output_path: str):
         chunk_list.sort(key=lambda x: int(os.path.basename(x).split(".")[0]))
 
-        with open(output_path, "wb") as f:
+        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
             for chunk_path in chunk_list:
-                with open(chunk_path, "rb") as chunk:
-                    f.write(chunk.read())
+                append_file(fd, chunk_path)
+                # Free each chunk as soon as it is merged to keep peak disk usage low
+                os.remove(chunk_path)
+        finally:
+            os.close(fd)
+        return output_path
+
+    def _stream_chunks(
+        self,
+        chunk_uris: List[str],
+        output_path: str, *,
+        num_workers: Optional[int] = 10,
+        retry: Optional[int] = 5,
+        buffer_size: Optional[int] = 20
+    ):
+        # Segments are written straight into the output file in playlist order,
+        # early arrivals wait in a bounded reorder buffer.
+        part_path = f"{output_path}.part"
+        self._session_pool.resize(num_workers)
+
+        try:
+            with open(part_path, "wb") as f:
+                writer = OrderedWriter(f, buffer_size=max(buffer_size, num_workers))
+
+                def task(x):
+                    index, chunk_uri = x
+                    try:
+                        writer.reserve(index)
+                        data = fetch(chunk_uri, retry=retry, session_pool=self._session_pool)
+                        writer.write(index, data)
+                    except Exception:
+                        # Release workers waiting for a segment that will never arrive
+                        writer.abort()
+                        raise
+
+                with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                    list(tqdm(executor.map(task, enumerate(chunk_uris)), total=len(chunk_uris)))
+        except Exception:
+            os.remove(part_path)
+            raise
+
+        os.replace(part_path, output_path)
         return output_path
 
     def _get_access_token(self, video_id: str):
@@ -221,7 +447,8 @@ class TwitchClient(APIWrapper):
         """
         query = query.format(video_id=video_id)
         headers = { "Client-ID": "kimne78kx3ncx6brgo4mv6wki5h1ko" }
-        res = requests.post(self.PRIVATE_API_URL, json={"query": query}, headers=headers)
+        session = self._session_pool.get(self.PRIVATE_API_URL)
+        res = session.post(self.PRIVATE_API_URL, json={"query": query}, headers=headers)
         return res.json()
 
     def _get_video_uri(
@@ -231,7 +458,8 @@ class TwitchClient(APIWrapper):
         bitrate: Optional[str] = "720p60"
     ):
         playlists_url = self.PLAYLISTS_URL.format(video_id)
-        res = requests.get(playlists_url, params={
+        session = self._session_pool.get(playlists_url)
+        res = session.get(playlists_url, params={
             "nauthsig": access_token["signature"],
             "nauth": access_token["value"],
             "allow_source": "true",
@@ -244,7 +472,8 @@ class TwitchClient(APIWrapper):
         return video_uri
 
     def _get_chunk_uris(self, video_uri: str):
-        res = requests.get(video_uri)
+        session = self._session_pool.get(video_uri)
+        res = session.get(video_uri)
         chunk_list = res.text.split("\n")
         chunk_list = list(filter(lambda x: re.match("(\w|\d)+\.ts", x), chunk_list))
 
@@ -1,18 +1,32 @@
-from typing import Optional
+from typing import Optional, Dict, Any, Iterator
 
 from pytube import YouTube
 
 from .base import APIWrapper
+from .cache import ResponseCache
+from .pagination import paginate
+from dury.session import SessionPool
 
 
 class YouTubeClient(APIWrapper):
     PUBLIC_API_URL = "https://www.googleapis.com/youtube/v3"
+    CACHE_TTL = {
+        "videoCategories": 24 * 60 * 60,
+        "guideCategories": 24 * 60 * 60,
+        "channels": 60 * 60
+    }
 
     def __init__(
         self,
-        api_key: str
+        api_key: str, *,
+        session_pool: Optional[SessionPool] = None,
+        cache: Optional[ResponseCache] = None
     ) -> None:
-        super(YouTubeClient, self).__init__(self.PUBLIC_API_URL)
+        super(YouTubeClient, self).__init__(
+            self.PUBLIC_API_URL,
+            session_pool=session_pool,
+            cache=cache
+        )
         self.api_key = api_key
 
     def get_activities(
@@ -231,6 +245,31 @@ class YouTubeClient(APIWrapper):
         res = self._get("search", params=params)
         return res
 
+    def iter_search(self, *, max_items: Optional[int] = None, buffer_size: Optional[int] = 2, **kwargs):
+        return self._paginate(self.search, kwargs, max_items=max_items, buffer_size=buffer_size)
+
+    def iter_comment_threads(self, *, max_items: Optional[int] = None, buffer_size: Optional[int] = 2, **kwargs):
+        return self._paginate(self.get_comment_threads, kwargs, max_items=max_items, buffer_size=buffer_size)
+
+    def iter_playlists(self, *, max_items: Optional[int] = None, buffer_size: Optional[int] = 2, **kwargs):
+        return self._paginate(self.get_playlists, kwargs, max_items=max_items, buffer_size=buffer_size)
+
+    def _paginate(
+        self,
+        method: Any,
+        kwargs: Dict[str, Any], *,
+        max_items: Optional[int] = None,
+        buffer_size: Optional[int] = 2
+    ) -> Iterator[Dict[str, Any]]:
+        kwargs.setdefault("max_results", 50)
+        return paginate(
+            lambda cursor: method(page_token=cursor, **kwargs),
+            items_key="items",
+            next_cursor=lambda page: page.get("nextPageToken"),
+            max_items=max_items,
+            buffer_size=buffer_size
+        )
+
     def download(
         self,
         video_url: str,
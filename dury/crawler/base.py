@@ -1,14 +1,27 @@
 import json
 import time
 import os
-from typing import Optional, Any
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Optional, Any, Iterator
 
 from selenium import webdriver
 from selenium.webdriver import Chrome
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from loguru import logger
+
+from .pool import DriverPool, PageCountingChrome
+from .profile import BrowserProfile, DEFAULT_PROFILE
+from .wait import WaitEngine, Condition
+from dury.metrics import Metrics, default_metrics
+from dury.session import SessionPool
 
 class SeleniumCrawler:
+    PROFILE = DEFAULT_PROFILE
+
     def __init__(
         self, *,
         output_dir: Optional[str] = "output",
@@ -16,12 +29,45 @@ class SeleniumCrawler:
         headless: Optional[bool] = False,
         implicitly_wait: Optional[float] = 10.0,
         safe_delay: Optional[float] = 1.0,
+        session_pool: Optional[SessionPool] = None,
+        pool_size: Optional[int] = 0,
+        max_pages_per_driver: Optional[int] = 100,
+        profile: Optional[BrowserProfile] = None,
+        metrics: Optional[Metrics] = None
     ) -> None:
         self.output_dir = output_dir
         self.safe_delay = safe_delay
         self.driver_path = driver_path
         self.headless = headless
         self.implicitly_wait = implicitly_wait
+        self.profile = profile if profile is not None else self.PROFILE
+        self.metrics = metrics if metrics is not None else default_metrics
+
+        self._owns_session_pool = session_pool is None
+        self._session_pool = session_pool if session_pool is not None else SessionPool()
+
+        self.pool_size = pool_size
+        self.max_pages_per_driver = max_pages_per_driver
+        self._driver_pool = None
+        self._driver_pool_lock = threading.Lock()
+        self._waits = WaitEngine()
+
+    def close(self) -> None:
+        summary = self.metrics.summary()
+        if summary:
+            logger.info(f"Crawl metrics\n{summary}")
+
+        if self._driver_pool is not None:
+            self._driver_pool.close()
+            self._driver_pool = None
+        if self._owns_session_pool:
+            self._session_pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
     def _launch(self) -> Chrome:
         options = webdriver.ChromeOptions()
@@ -29,24 +75,107 @@ class SeleniumCrawler:
             options.add_argument("--headless")
         options.add_argument('--no-sandbox')
         options.add_argument("--disable-dev-shm-usage")
-        options.add_argument("--remote-debugging-port=9222")
-        driver = Chrome(executable_path=self.driver_path, chrome_options=options)
+        # A free port per browser lets several crawlers share one host
+        options.add_argument(f"--remote-debugging-port={self._find_free_port()}")
+        capabilities = self.profile.apply(options)
+        with self.metrics.timer("browser_launch"):
+            driver = PageCountingChrome(
+                executable_path=self.driver_path,
+                chrome_options=options,
+                desired_capabilities=capabilities
+            )
+            self.profile.install(driver)
+        driver.metrics = self.metrics
         driver.implicitly_wait(self.implicitly_wait)
         return driver
 
+    @contextmanager
+    def _driver(self, timeout: Optional[float] = None) -> Iterator[Chrome]:
+        if self.pool_size > 0:
+            with self._driver_pool_lock:
+                if self._driver_pool is None:
+                    self._driver_pool = DriverPool(
+                        self._launch,
+                        size=self.pool_size,
+                        max_pages=self.max_pages_per_driver
+                    )
+            with self._driver_pool.lease(timeout) as driver:
+                yield driver
+            return
+
+        driver = self._launch()
+        try:
+            yield driver
+        finally:
+            driver.quit()
+
+    def _find_free_port(self) -> int:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
     def _delay(self, seconds: Optional[float] = None) -> None:
         if seconds is not None:
             time.sleep(seconds)
         else:
             time.sleep(self.safe_delay)
 
-    def _explicitly_wait(self, driver: Chrome, timeout: float, condition: Any) -> WebDriverWait:
-        return WebDriverWait(driver, timeout).until(condition)
+    def _wait(
+        self,
+        driver: Chrome,
+        name: str,
+        condition: Condition, *,
+        baseline: Optional[float] = None
+    ) -> bool:
+        # Replaces a fixed delay of baseline seconds by polling for the
+        # condition, within bounds learned from earlier waits of the same name
+        baseline = baseline if baseline is not None else self.safe_delay
+        min_wait, max_wait = self._waits.bounds(name, baseline)
+
+        started = time.monotonic()
+        if min_wait > 0:
+            time.sleep(min_wait)
+        try:
+            self._explicitly_wait(
+                driver, max(max_wait - min_wait, 0.1), condition,
+                poll_frequency=0.1, ignored_exceptions=(WebDriverException,)
+            )
+        except TimeoutException:
+            self.metrics.inc("wait_timeouts", step=name)
+            logger.debug(f"Wait for {name} timed out after {time.monotonic() - started:.2f}s")
+            return False
+
+        elapsed = time.monotonic() - started
+        self._waits.record(name, elapsed, baseline)
+        self.metrics.observe("wait", elapsed, step=name)
+        # Saved time goes negative when a wait outlasts its baseline, so it
+        # is exported as a gauge rather than a counter
+        self.metrics.set("wait_saved_seconds", self._waits.saved(name), step=name)
+        logger.debug(f"Wait for {name} took {elapsed:.2f}s, saved {baseline - elapsed:.2f}s")
+        return True
+
+    def _explicitly_wait(
+        self,
+        driver: Chrome,
+        timeout: float,
+        condition: Any, *,
+        poll_frequency: Optional[float] = 0.5,
+        ignored_exceptions: Optional[Any] = None
+    ) -> WebDriverWait:
+        return WebDriverWait(
+            driver, timeout,
+            poll_frequency=poll_frequency,
+            ignored_exceptions=ignored_exceptions
+        ).until(condition)
 
     def _save_cookies(self, driver: Chrome, output_path: str) -> None:
         cookies = driver.get_cookies()
-        with open(output_path, "w") as f:
+        # Written aside and renamed, so a browser launching meanwhile never
+        # loads half a file
+        tmp_path = f"{output_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
             json.dump(cookies, f, indent=4)
+        os.replace(tmp_path, output_path)
 
     def _load_cookies(self, driver: Chrome, cookie_file: str, domain: str) -> int:
         driver.get(domain)
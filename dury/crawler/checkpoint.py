@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+from typing import Optional, List, Dict, Any
+
+from loguru import logger
+
+
+class Checkpoint:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.urls: Optional[List[str]] = None
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self.completed = False
+        self._lock = threading.Lock()
+
+        torn = self._load()
+        if self.completed:
+            # Only an unfinished run is resumed, a finished one is rotated
+            # away so the next run lists its urls afresh
+            os.replace(path, f"{path}.done")
+            self.urls = None
+            self._records = {}
+            self.completed = False
+            torn = False
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._f = open(path, "a", encoding="utf-8")
+        if torn:
+            # Terminate the half written line so new entries start on their own
+            self._f.write("\n")
+
+    def _load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+
+        line = ""
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash can leave the last line half written
+                    logger.info(f"Skip broken checkpoint entry in {self.path}")
+                    continue
+
+                if entry["type"] == "urls":
+                    self.urls = entry["urls"]
+                elif entry["type"] == "record":
+                    self._records[entry["key"]] = entry["data"]
+                elif entry["type"] == "complete":
+                    self.completed = True
+        return line != "" and not line.endswith("\n")
+
+    def save_urls(self, urls: List[str]) -> None:
+        self.urls = list(urls)
+        self._append({ "type": "urls", "urls": self.urls })
+
+    def done(self, key: str) -> bool:
+        return key in self._records
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._records.get(key)
+
+    def record(self, key: str, data: Dict[str, Any]) -> None:
+        self._records[key] = data
+        self._append({ "type": "record", "key": key, "data": data })
+
+    def complete(self) -> None:
+        self.completed = True
+        self._append({ "type": "complete" })
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        self._f.close()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
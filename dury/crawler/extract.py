@@ -0,0 +1,123 @@
+from typing import Optional, Dict, Any
+
+from selenium.webdriver import Chrome
+from selenium.webdriver.remote.webelement import WebElement
+
+from dury.metrics import default_metrics
+
+
+# Every field is described by an optional CSS selector relative to its parent
+# scope, an attribute to read ("text" for the rendered text, "element" for the
+# node itself) or nested fields, and whether all matches are collected.
+SELECTORS = {
+    "google_image_results": {
+        "rel_keywords": { "selector": ".UwAaac", "many": True, "attr": "text" }
+    },
+    "google_image_containers": {
+        "node": { "attr": "element" }
+    },
+    "google_image_preview": {
+        "link": {
+            "selector": "a[role='link']", "index": 2,
+            "fields": { "src": { "selector": "img", "attr": "src" } }
+        }
+    },
+    "naver_image_thumbnail": {
+        "src": { "selector": "img", "attr": "src" }
+    },
+    "naver_image_results": {
+        "rel_keywords": { "selector": ".tag_bx .txt", "many": True, "attr": "text" }
+    },
+    "instagram_article_link": {
+        "href": { "attr": "href" }
+    },
+    "instagram_article": {
+        "header": { "selector": "article header", "attr": "text" },
+        "image_urls": { "selector": "article .FFVAD", "many": True, "attr": "src" },
+        "like": { "selector": "article a[href*='liked_by']", "attr": "text" },
+        "datetimes": { "selector": "article time", "many": True, "attr": "datetime" },
+        "text": { "selector": "article li[role='menuitem']", "attr": "text" }
+    },
+    "instagram_tags": {
+        "tags": { "selector": "article a[href*='/explore/tags']", "many": True, "attr": "text" }
+    },
+    "instagram_comment": {
+        "text": { "attr": "text" },
+        "meta": {
+            "selector": ".FH9sR", "many": True,
+            "fields": {
+                "datetime": { "attr": "datetime" },
+                "text": { "attr": "text" }
+            }
+        }
+    },
+    "pixiv_artwork": {
+        "caption": {
+            "selector": "figcaption",
+            "fields": {
+                "title": { "selector": "h1", "attr": "text" },
+                "desc": { "selector": "p", "attr": "text" },
+                "tags": { "selector": "footer a", "many": True, "attr": "text" }
+            }
+        },
+        "figure": {
+            "selector": "figure",
+            "fields": {
+                "image_urls": { "selector": "img", "many": True, "attr": "src" }
+            }
+        }
+    }
+}
+
+
+EXTRACT_FUNCTIONS = """
+function read(node, attr) {
+    if (!node) return null;
+    if (attr === "element") return node;
+    if (attr === undefined || attr === "text") return node.innerText;
+    // Properties resolve relative URLs like WebElement.get_attribute does
+    const value = node[attr];
+    return (value !== undefined && typeof value !== "object") ? value : node.getAttribute(attr);
+}
+
+function extract(scope, fields) {
+    const out = {};
+    for (const [name, field] of Object.entries(fields)) {
+        if (field.many) {
+            const nodes = field.selector ? Array.from(scope.querySelectorAll(field.selector)) : [scope];
+            out[name] = nodes.map(node => field.fields ? extract(node, field.fields) : read(node, field.attr));
+            continue;
+        }
+
+        let node = scope;
+        if (field.selector) {
+            node = field.index !== undefined
+                ? scope.querySelectorAll(field.selector)[field.index]
+                : scope.querySelector(field.selector);
+        }
+        out[name] = field.fields ? (node ? extract(node, field.fields) : null) : read(node, field.attr);
+    }
+    return out;
+}
+"""
+
+EXTRACT_SCRIPT = EXTRACT_FUNCTIONS + """
+return extract(arguments[0] || document, arguments[1]);
+"""
+
+
+def extract(
+    driver: Chrome,
+    spec: Dict[str, Any], *,
+    root: Optional[WebElement] = None
+) -> Dict[str, Any]:
+    metrics = getattr(driver, "metrics", default_metrics)
+    with metrics.timer("dom_extract"):
+        return driver.execute_script(EXTRACT_SCRIPT, root, spec)
+
+
+def count(driver: Chrome, selector: str, *, root: Optional[WebElement] = None) -> int:
+    return driver.execute_script(
+        "return (arguments[0] || document).querySelectorAll(arguments[1]).length;",
+        root, selector
+    )
@@ -1,29 +1,57 @@
 import os
-from concurrent.futures import ThreadPoolExecutor
-from typing import Optional, List
+from typing import Optional, List, Iterator
 
 from selenium.webdriver import Chrome
-from selenium.webdriver.common.by import By
 from loguru import logger
-from tqdm import tqdm
 
 from .base import SeleniumCrawler
-from dury.utils import download, get_extension
+from .profile import PROFILES
+from .extract import SELECTORS, extract
+from .scroll import ScrollHarvester
+from .wait import Condition
+from dury.pipeline import DownloadResult, download_pipelined
+from dury.store import ContentStore
+from dury.utils import download_many, get_extension
 
 
 class GoogleImageCralwer(SeleniumCrawler):
+    PROFILE = PROFILES["google"]
     GOOGLE_URL = "https://www.google.com"
 
     def __init__(self, *args, **kwargs) -> None:
         super(GoogleImageCralwer, self).__init__(*args, **kwargs)
 
     def run_on_keyword(self, keyword: str, *, limit: Optional[int] = 100):
-        driver = self._launch()
-        try:
+        with self._driver() as driver:
             image_urls = self.get_image_urls(driver, keyword, limit=limit)
             return image_urls
-        finally:
-            driver.quit()
+
+    def stream_on_keyword(
+        self,
+        keyword: str, *,
+        limit: Optional[int] = 100,
+        output_dir: Optional[str] = "output/google",
+        num_workers: Optional[int] = 10,
+        buffer_size: Optional[int] = 100,
+        store: Optional[ContentStore] = None
+    ) -> Iterator[DownloadResult]:
+        os.makedirs(output_dir, exist_ok=True)
+
+        def scrape():
+            with self._driver() as driver:
+                image_urls = self.iter_image_urls(driver, keyword, limit=limit)
+                for i, image_url in enumerate(image_urls):
+                    output_path = os.path.join(output_dir, f"{str(i).zfill(6)}.{get_extension(image_url)}")
+                    yield image_url, output_path
+
+        return download_pipelined(
+            scrape(),
+            num_workers=num_workers,
+            buffer_size=buffer_size,
+            session_pool=self._session_pool,
+            store=store,
+            metrics=self.metrics
+        )
 
     def get_image_urls(
         self,
@@ -32,54 +60,71 @@ class GoogleImageCralwer(SeleniumCrawler):
         limit: Optional[int] = 100,
         max_retry: Optional[int] = 5
     ):
+        image_urls = list(self.iter_image_urls(driver, keyword, limit=limit, max_retry=max_retry))
+        rel_keywords = extract(driver, SELECTORS["google_image_results"])["rel_keywords"]
+        return image_urls, rel_keywords
+
+    def iter_image_urls(
+        self,
+        driver: Chrome,
+        keyword: str, *,
+        limit: Optional[int] = 100,
+        max_retry: Optional[int] = 5
+    ) -> Iterator[str]:
         image_search_url = f"{self.GOOGLE_URL}/search?q={keyword}&tbm=isch"
         driver.get(image_search_url)
 
-        prev_num_elements = 0
-        retry_cnt = max_retry
-
-        image_containers = []
-        while (retry_cnt > 0 and prev_num_elements < 10000):
-            image_containers = driver.find_elements(By.CLASS_NAME, "islib")
-            if prev_num_elements == len(image_containers):
-                retry_cnt -= 1
-            else:
-                retry_cnt = max_retry
-                prev_num_elements = len(image_containers)
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            self._delay(0.5)
-
-        image_urls = []
-        for image_container in image_containers[:limit]:
+        harvester = ScrollHarvester(driver, ".islib", SELECTORS["google_image_containers"])
+        image_containers = [
+            record["node"]
+            for record in harvester.harvest(limit=min(limit, 10000), max_retry=max_retry)
+        ]
+
+        for image_container in image_containers:
+            # The side panel keeps the previous image until the new one is in
+            previous_url = self._preview_src(driver)
             image_container.click()
-            self._delay(0.5)
+            self._wait(driver, "google_image_preview", self._preview_loaded(previous_url), baseline=0.5)
             try:
-                image_link = driver.find_elements(By.XPATH, ".//a[@role='link']")[2]
-                image_element = image_link.find_element(By.TAG_NAME, "img")
-                image_url = image_element.get_attribute("src")
-                if "http" in image_url[:4]:
-                    image_urls.append(image_url)
+                image_url = self._preview_src(driver)
+                if "http" in image_url[:4] and image_url != previous_url:
+                    yield image_url
             except Exception as e:
+                self.metrics.inc("errors", stage="google_preview")
                 logger.error(e)
 
-        tag_elements = driver.find_elements(By.CLASS_NAME, "UwAaac")
-        rel_keywords = [ tag_element.text for tag_element in tag_elements ]
-        return image_urls, rel_keywords
+    def _preview_src(self, driver: Chrome) -> str:
+        link = extract(driver, SELECTORS["google_image_preview"])["link"]
+        return (link["src"] if link is not None else None) or ""
+
+    def _preview_loaded(self, previous_url: str) -> Condition:
+        # The thumbnail is shown first, served from encrypted-tbn over https
+        def condition(driver: Chrome) -> bool:
+            image_url = self._preview_src(driver)
+            return "http" in image_url[:4] and image_url != previous_url and "encrypted-tbn" not in image_url
+        return condition
 
     def download_images(
         self,
         image_urls: List[str], *,
         output_dir: Optional[str] = "output/google",
-        num_workers: Optional[int] = 10
+        num_workers: Optional[int] = 10,
+        engine: Optional[str] = "thread",
+        store: Optional[ContentStore] = None
     ):
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        task_inputs = []
+        tasks = []
         for i, image_url in enumerate(image_urls):
-            task_inputs.append((i, image_url))
-        task = lambda x: download(x[1], os.path.join(output_dir, f"{str(x[0]).zfill(6)}.{get_extension(image_url)}"))
+            output_path = os.path.join(output_dir, f"{str(i).zfill(6)}.{get_extension(image_url)}")
+            tasks.append((image_url, output_path))
 
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            results = list(tqdm(executor.map(task, task_inputs), total=len(image_urls)))
-        return results
+        return download_many(
+            tasks,
+            engine=engine,
+            num_workers=num_workers,
+            session_pool=self._session_pool,
+            store=store,
+            metrics=self.metrics
+        )
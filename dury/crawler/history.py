@@ -0,0 +1,38 @@
+import json
+import os
+import threading
+from typing import Optional, List, Dict, Set
+
+
+class CrawlHistory:
+    def __init__(self, path: str, *, max_ids: Optional[int] = 1000) -> None:
+        self.path = path
+        self.max_ids = max_ids
+        self._lock = threading.Lock()
+
+        self._targets: Dict[str, List[str]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self._targets = json.load(f)
+
+    def known(self, target: str) -> Set[str]:
+        return set(self._targets.get(target, []))
+
+    def update(self, target: str, ids: List[str]) -> None:
+        # Ids are kept newest first and only the most recent ones are needed
+        # to recognise where the previous run stopped
+        with self._lock:
+            known = self.known(target)
+            new_ids = [ item for item in dict.fromkeys(ids) if item not in known ]
+            self._targets[target] = (new_ids + self._targets.get(target, []))[:self.max_ids]
+            self._save()
+
+    def _save(self) -> None:
+        dirname = os.path.dirname(self.path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._targets, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path)
@@ -1,6 +1,8 @@
 import os
-from dataclasses import dataclass, field
-from typing import Optional, List
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Optional, List, Set, Dict, Any, Union
+from urllib.parse import urlparse
 
 from selenium.webdriver import Chrome
 from selenium.webdriver.support.ui import WebDriverWait
@@ -10,9 +12,17 @@ from loguru import logger
 from tqdm import tqdm
 
 from .base import SeleniumCrawler
+from .checkpoint import Checkpoint
+from .history import CrawlHistory
+from .profile import PROFILES
+from .extract import SELECTORS, extract
+from .scroll import ScrollHarvester
+from .wait import element_count_at_least, document_ready, network_idle, all_of
+from dury.records import SLOTS
+from dury.sink import RecordSink
 
 
-@dataclass
+@dataclass(**SLOTS)
 class Comment:
     username: str
     text: Optional[str] = ""
@@ -20,7 +30,7 @@ class Comment:
     datetime: Optional[str] = ""
 
 
-@dataclass
+@dataclass(**SLOTS)
 class Article:
     username: str
     article_id: str
@@ -33,6 +43,7 @@ class Article:
 
 
 class InstagramCrawler(SeleniumCrawler):
+    PROFILE = PROFILES["instagram"]
     INSTAGRAM_URL = "https://www.instagram.com"
     LOGIN_URL = "https://www.instagram.com/accounts/login"
 
@@ -49,177 +60,243 @@ class InstagramCrawler(SeleniumCrawler):
         self.__password = password
         self.cookie_file = cookie_file
 
-    def run_on_user(self, user: str, *, limit: Optional[int] = 100):
-        driver = self._launch()
-
-        try:
+    def run_on_user(
+        self,
+        user: str, *,
+        limit: Optional[int] = 100,
+        checkpoint_file: Optional[str] = None,
+        history_file: Optional[str] = None,
+        max_comments: Optional[int] = None
+    ):
+        with self._driver() as driver:
             main_page_url = f"{self.INSTAGRAM_URL}/{user}/"
-            article_urls = self.get_article_urls(driver, main_page_url, limit=limit)
-            articles = self.collect_articles(driver, article_urls, limit=limit)
-            return articles
-        finally:
-            driver.quit()
+            return self._crawl(
+                driver, main_page_url,
+                limit=limit, checkpoint_file=checkpoint_file,
+                history_file=history_file, max_comments=max_comments, target=f"user:{user}"
+            )
 
     def run_on_hashtag(
         self,
         hashtag: str, *,
-        limit: Optional[int] = 100
+        limit: Optional[int] = 100,
+        checkpoint_file: Optional[str] = None,
+        history_file: Optional[str] = None,
+        max_comments: Optional[int] = None
     ):
-        driver = self._launch()
+        with self._driver() as driver:
+            main_page_url = f"{self.INSTAGRAM_URL}/explore/tags/{hashtag}/"
+            return self._crawl(
+                driver, main_page_url,
+                limit=limit, checkpoint_file=checkpoint_file,
+                history_file=history_file, max_comments=max_comments, target=f"hashtag:{hashtag}"
+            )
 
+    def _crawl(
+        self,
+        driver: Chrome,
+        main_page_url: str, *,
+        limit: Optional[int] = 100,
+        checkpoint_file: Optional[str] = None,
+        history_file: Optional[str] = None,
+        max_comments: Optional[int] = None,
+        target: Optional[str] = None
+    ) -> List[Article]:
+        # Only articles newer than the ones seen on the previous run are listed
+        history = CrawlHistory(history_file) if history_file is not None else None
+        known = history.known(target) if history is not None else None
+
+        checkpoint = Checkpoint(checkpoint_file) if checkpoint_file is not None else None
         try:
-            main_page_url = f"{self.INSTAGRAM_URL}/explore/tags/{hashtag}/"
-            article_urls = self.get_article_urls(driver, main_page_url, limit=limit)
-            articles = self.collect_articles(driver, article_urls, limit=limit)
-            return articles
+            article_urls = checkpoint.urls if checkpoint is not None else None
+            if article_urls is None:
+                article_urls = self.get_article_urls(driver, main_page_url, limit=limit, known=known)
+                if checkpoint is not None:
+                    checkpoint.save_urls(article_urls)
+
+            articles = self.collect_articles(
+                driver, article_urls,
+                limit=limit, checkpoint=checkpoint, max_comments=max_comments
+            )
+            if checkpoint is not None:
+                checkpoint.complete()
         finally:
-            driver.quit()
+            if checkpoint is not None:
+                checkpoint.close()
+
+        if history is not None:
+            history.update(target, [ article.article_id for article in articles if article.image_urls ])
+        return articles
 
     def get_article_urls(
         self,
         driver: Chrome,
         main_page_url: str, *,
         limit: Optional[int] = 100,
-        max_retry: Optional[int] = 5
+        max_retry: Optional[int] = 5,
+        known: Optional[Set[str]] = None,
+        max_known: Optional[int] = 12
     ) -> List[str]:
         driver.get(main_page_url)
 
+        # The grid recycles its rows while scrolling, so a link can be queued again
+        harvester = ScrollHarvester(driver, "article a", SELECTORS["instagram_article_link"])
         cache = {}
-        prev_num_urls = 0
-        retry_cnt = max_retry
-
-        while (retry_cnt > 0 and len(cache.keys()) < limit):
-            article_element = driver.find_element(By.TAG_NAME, "article")
-            article_links = article_element.find_elements(By.TAG_NAME, "a")
-
-            for article_link in article_links:
-                href = article_link.get_attribute("href")
-                if href not in cache:
-                    cache[href] = None
+        seen_known = set()
+        # A target with only a few known articles can never show more of them
+        max_seen = min(max_known, len(known)) if known else 0
+        for record in harvester.harvest(limit=10000, max_retry=max_retry):
+            href = record["href"]
+            article_id = self._article_id(href)
+            if known and article_id in known:
+                # Pinned and top posts come before the newest ones, so only
+                # several known articles mean the previous run was reached.
+                # They are not required in a row, an article that failed last
+                # time leaves a gap between them and is collected again.
+                seen_known.add(article_id)
+                if len(seen_known) >= max_seen:
+                    break
+                continue
 
-            if prev_num_urls == len(cache.keys()):
-                retry_cnt -= 1
-            else:
-                retry_cnt = max_retry
-            
-            prev_num_urls = len(cache.keys())
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            self._delay(1)
+            cache[href] = None
+            if len(cache) >= limit:
+                break
 
         return list(cache.keys())
 
+    def _article_id(self, article_url: str) -> str:
+        return urlparse(article_url).path.rstrip("/").split("/")[-1]
+
     def collect_articles(
         self,
         driver: Chrome,
         article_urls: List[str], *,
         limit: Optional[int] = 100,
         retry: Optional[int] = 5,
-        safe_delay: Optional[float] = 10
-    ) -> List[Article]:
+        safe_delay: Optional[float] = 10,
+        checkpoint: Optional[Checkpoint] = None,
+        sink: Optional[RecordSink] = None,
+        max_comments: Optional[int] = None
+    ) -> Union[List[Article], int]:
+        # With a sink, records are written as they finish instead of being
+        # kept, and the number of written articles is returned
         articles = []
+        num_articles = 0
         for article_url in tqdm(article_urls[:limit]):
-            article = self.get_article(driver, article_url, retry=retry)
-            articles.append(article)
-            self._delay(safe_delay)
+            if checkpoint is not None and checkpoint.done(article_url):
+                article = self._load_article(checkpoint.get(article_url))
+            else:
+                started = time.monotonic()
+                article = self.get_article(driver, article_url, retry=retry, max_comments=max_comments)
+                # Articles that failed to load are left for the next run
+                if checkpoint is not None and article.image_urls:
+                    checkpoint.record(article_url, asdict(article))
+                # Keep articles at least safe_delay apart, counting the time
+                # already spent loading this one
+                self._delay(max(0, safe_delay - (time.monotonic() - started)))
+
+            num_articles += 1
+            if sink is not None:
+                sink.write(article)
+            else:
+                articles.append(article)
+
+        if sink is not None:
+            sink.flush()
+            return num_articles
         return articles
 
+    def _load_article(self, data: Dict[str, Any]) -> Article:
+        comments = [ Comment(**comment) for comment in data["comments"] ]
+        return Article(**{ **data, "comments": comments })
+
     def get_article(
         self,
         driver: Chrome,
         article_url: str, *,
-        retry: Optional[int] = 5
+        retry: Optional[int] = 5,
+        max_comments: Optional[int] = None
     ) -> Article:
         driver.get(article_url)
 
-        article_element = driver.find_element(By.TAG_NAME, "article")
-        header_element = article_element.find_element(By.TAG_NAME, "header")
-        username = header_element.text.split("\n")[0]
+        self._explicitly_wait(
+            driver, self.implicitly_wait,
+            EC.presence_of_element_located((By.CSS_SELECTOR, "article header"))
+        )
+        fields = extract(driver, SELECTORS["instagram_article"])
+        username = fields["header"].split("\n")[0]
         article_id = driver.current_url.split("/")[-2]
 
         try:
-            image_elements = article_element.find_elements(By.CLASS_NAME, "FFVAD")
-            image_urls = [ image_element.get_attribute("src") for image_element in image_elements ]
-            
-            like_element = article_element.find_element_by_xpath(".//a[contains(@href, 'liked_by')]")
-            like_count = int(like_element.text.split(" ")[0].replace(",", ""))
-            
-            time_element = article_element.find_elements(By.TAG_NAME, "time")[-1]
-            d_time = time_element.get_attribute("datetime")
-
-            main_element = article_element.find_element_by_xpath(".//li[@role='menuitem']")
-            
-            comments = self.get_comments(driver)
+            image_urls = fields["image_urls"]
+            like_count = int(fields["like"].split(" ")[0].replace(",", ""))
+            d_time = fields["datetimes"][-1]
+            text = fields["text"]
+            if text is None:
+                raise ValueError("Article text is not loaded")
+
+            comments = self.get_comments(driver, max_comments=max_comments)
 
             try:
-                tag_elements = article_element.find_elements_by_xpath(".//a[contains(@href, '/explore/tags')]")
-                tags = [ tag_element.text for tag_element in tag_elements ]
+                tags = extract(driver, SELECTORS["instagram_tags"])["tags"]
             except Exception as e:
                 logger.info(e)
                 tags = []
 
             article = Article(
-                username, article_id, main_element.text,
+                username, article_id, text,
                 like_count, d_time, image_urls, tags, comments
             )
             return article
         except Exception as e:
+            self.metrics.inc("errors", stage="instagram_article")
             logger.error(e)
 
             if retry > 1:
-                return self.get_article(driver, article_url, retry=retry - 1)
+                return self.get_article(driver, article_url, retry=retry - 1, max_comments=max_comments)
             else:
                 return Article(username, article_id)
 
     def get_comments(
         self,
         driver: Chrome,
-        max_retry: Optional[int] = 5
+        max_retry: Optional[int] = 5,
+        max_comments: Optional[int] = None,
+        min_click_interval: Optional[float] = 0.5
     ) -> List[Comment]:
-        article_element = driver.find_element(By.TAG_NAME, "article")
-
-        prev_num_comments = 0
-        retry_cnt = max_retry
-        while(retry_cnt > 0):
-            try:
-                more_button = article_element.find_element_by_xpath(".//span[contains(@aria-label, 'Load more comments')]")
-                more_button.click()
-                self._delay(2)
-                comment_elements = article_element.find_elements(By.CLASS_NAME, "Mr508")
-                
-                if prev_num_comments == len(comment_elements):
-                    retry_cnt -= 1
-                else:
-                    retry_cnt = max_retry
-
-                prev_num_comments = len(comment_elements)
-            except Exception as e:
-                logger.info(e)
-                break
-
+        # Only the comments each click adds are read back. Clicks are paced
+        # by how long the comments have been taking to arrive, and stay at
+        # least min_click_interval apart
+        harvester = ScrollHarvester(
+            driver, "article .Mr508", SELECTORS["instagram_comment"],
+            more_selector="article span[aria-label*='Load more comments']",
+            timeout=5.0,
+            interval=min_click_interval
+        )
+        limit = max_comments if max_comments is not None else 100000
         try:
-            comment_elements = article_element.find_elements(By.CLASS_NAME, "Mr508")
+            comment_fields = list(harvester.harvest(limit=limit, max_retry=max_retry))
         except Exception as e:
             logger.info(e)
-            comment_elements = []
+            comment_fields = []
 
         comments = []
-        for comment_element in comment_elements:
-            meta_elements = comment_element.find_elements(By.CLASS_NAME, "FH9sR")
-            try:
-                d_time = meta_elements[0].get_attribute("datetime")
-            except Exception as e:
-                logger.info(e)
+        for fields in comment_fields:
+            meta = fields["meta"]
+            if len(meta) == 0:
+                logger.info("Comment has no timestamp")
                 continue
+            d_time = meta[0]["datetime"]
 
-            if len(meta_elements) == 3:
-                like_count = int(meta_elements[1].text.split(" ")[0].replace(",", ""))
+            if len(meta) == 3:
+                like_count = int(meta[1]["text"].split(" ")[0].replace(",", ""))
             else:
                 like_count = 0
 
-            username = comment_element.text.split("\n")[0]
+            username = fields["text"].split("\n")[0]
             comment = Comment(
                 username,
-                comment_element.text,
+                fields["text"],
                 like_count,
                 d_time
             )
@@ -231,12 +308,13 @@ class InstagramCrawler(SeleniumCrawler):
         driver = super()._launch()
         status = self._load_cookies(driver, self.cookie_file, self.INSTAGRAM_URL)
         if status < 0:
-            self._login(driver)
+            with self.metrics.timer("login", site="instagram"):
+                self._login(driver)
         return driver
 
     def _login(self, driver: Chrome):
         driver.get(self.LOGIN_URL)
-        self._delay()
+        self._wait(driver, "instagram_login_form", element_count_at_least("#loginForm input[type='password']"))
 
         login_element = driver.find_element(By.ID, "loginForm")
         login_button = login_element.find_element(By.TAG_NAME, "button")
@@ -245,12 +323,12 @@ class InstagramCrawler(SeleniumCrawler):
         password_input_element = login_element.find_element_by_xpath(".//input[@type='password']")
         password_input_element.send_keys(self.__password)
         login_button.click()
-        self._delay(8)
+        self._wait(driver, "instagram_login", element_count_at_least("main button"), baseline=8)
 
         main = driver.find_element(By.TAG_NAME, "main")
         save_info_button = main.find_element(By.TAG_NAME, "button")
         save_info_button.click()
-        self._delay(5)
+        self._wait(driver, "instagram_save_info", all_of(document_ready(), network_idle()), baseline=5)
         
         try:
             element = WebDriverWait(driver, 60).until(EC.presence_of_element_located((By.ID, "react-root")))
@@ -1,29 +1,56 @@
 import os
-from concurrent.futures import ThreadPoolExecutor
-from typing import Optional, List
+from typing import Optional, List, Iterator
 
 from selenium.webdriver import Chrome
-from selenium.webdriver.common.by import By
 from loguru import logger
-from tqdm import tqdm
 
 from .base import SeleniumCrawler
-from dury.utils import download, get_extension
+from .profile import PROFILES
+from .extract import SELECTORS, extract
+from .scroll import ScrollHarvester
+from dury.pipeline import DownloadResult, download_pipelined
+from dury.store import ContentStore
+from dury.utils import download_many, get_extension
 
 
 class NaverImageCralwer(SeleniumCrawler):
+    PROFILE = PROFILES["naver"]
     NAVER_SEARCH_URL = "https://search.naver.com/"
 
     def __init__(self, *args, **kwargs) -> None:
         super(NaverImageCralwer, self).__init__(*args, **kwargs)
 
     def run_on_keyword(self, keyword: str, *, limit: Optional[int] = 100):
-        driver = self._launch()
-        try:
+        with self._driver() as driver:
             image_urls = self.get_image_urls(driver, keyword, limit=limit)
             return image_urls
-        finally:
-            driver.quit()
+
+    def stream_on_keyword(
+        self,
+        keyword: str, *,
+        limit: Optional[int] = 100,
+        output_dir: Optional[str] = "output/naver",
+        num_workers: Optional[int] = 10,
+        buffer_size: Optional[int] = 100,
+        store: Optional[ContentStore] = None
+    ) -> Iterator[DownloadResult]:
+        os.makedirs(output_dir, exist_ok=True)
+
+        def scrape():
+            with self._driver() as driver:
+                image_urls = self.iter_image_urls(driver, keyword, limit=limit)
+                for i, image_url in enumerate(image_urls):
+                    output_path = os.path.join(output_dir, f"{str(i).zfill(6)}.{get_extension(image_url)}")
+                    yield image_url, output_path
+
+        return download_pipelined(
+            scrape(),
+            num_workers=num_workers,
+            buffer_size=buffer_size,
+            session_pool=self._session_pool,
+            store=store,
+            metrics=self.metrics
+        )
 
     def get_image_urls(
         self,
@@ -32,55 +59,50 @@ class NaverImageCralwer(SeleniumCrawler):
         limit: Optional[int] = 100,
         max_retry: Optional[int] = 5
     ):
+        image_urls = list(self.iter_image_urls(driver, keyword, limit=limit, max_retry=max_retry))
+        rel_keywords = extract(driver, SELECTORS["naver_image_results"])["rel_keywords"]
+        return image_urls, rel_keywords
+
+    def iter_image_urls(
+        self,
+        driver: Chrome,
+        keyword: str, *,
+        limit: Optional[int] = 100,
+        max_retry: Optional[int] = 5
+    ) -> Iterator[str]:
         image_search_url = f"{self.NAVER_SEARCH_URL}/search.naver?where=image&query={keyword}"
         driver.get(image_search_url)
 
-        prev_num_elements = 0
-        retry_cnt = max_retry
-
-        image_containers = []
-        while (retry_cnt > 0 and prev_num_elements < 10000):
-            image_containers = driver.find_elements(By.CLASS_NAME, "thumb")
-            if prev_num_elements == len(image_containers):
-                retry_cnt -= 1
-            else:
-                retry_cnt = max_retry
-                prev_num_elements = len(image_containers)
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            self._delay(0.5)
-
-        image_urls = []
-        for image_container in image_containers[:limit]:
-            try:
-                image_element = image_container.find_element(By.TAG_NAME, "img")
-                image_url = image_element.get_attribute("src")
-                if "http" in image_url[:4]:
-                    image_urls.append(image_url)
-            except Exception as e:
-                logger.error(e)
-
-        rel_keywords = []
-        tag_containers = driver.find_elements(By.CLASS_NAME, "tag_bx")
-        for tag_container in tag_containers:
-            tag_elements = tag_container.find_elements(By.CLASS_NAME, "txt")
-            tags = [ tag_element.text for tag_element in tag_elements ]
-            rel_keywords += tags
-        return image_urls, rel_keywords
+        harvester = ScrollHarvester(driver, ".thumb", SELECTORS["naver_image_thumbnail"])
+        for thumbnail in harvester.harvest(limit=min(limit, 10000), max_retry=max_retry):
+            image_url = thumbnail["src"]
+            if image_url is None:
+                self.metrics.inc("errors", stage="naver_thumbnail")
+                logger.error("No image in thumbnail")
+            elif "http" in image_url[:4]:
+                yield image_url
 
     def download_images(
         self,
         image_urls: List[str], *,
         output_dir: Optional[str] = "output/naver",
-        num_workers: Optional[int] = 10
+        num_workers: Optional[int] = 10,
+        engine: Optional[str] = "thread",
+        store: Optional[ContentStore] = None
     ):
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        task_inputs = []
+        tasks = []
         for i, image_url in enumerate(image_urls):
-            task_inputs.append((i, image_url))
-        task = lambda x: download(x[1], os.path.join(output_dir, f"{str(x[0]).zfill(6)}.{get_extension(image_url)}"))
+            output_path = os.path.join(output_dir, f"{str(i).zfill(6)}.{get_extension(image_url)}")
+            tasks.append((image_url, output_path))
 
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            results = list(tqdm(executor.map(task, task_inputs), total=len(image_urls)))
-        return results
+        return download_many(
+            tasks,
+            engine=engine,
+            num_workers=num_workers,
+            session_pool=self._session_pool,
+            store=store,
+            metrics=self.metrics
+        )
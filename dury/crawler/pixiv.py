@@ -1,10 +1,15 @@
 import os
-from dataclasses import dataclass, field
-import copy
+import re
+import html
+import json
+import threading
+from dataclasses import dataclass, field, asdict
 from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
 from urllib.parse import urlparse
-from typing import Optional, List
+from typing import Optional, List, Set, Union, Iterable, Iterator
 
+import requests
 from selenium.webdriver import Chrome
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -12,11 +17,20 @@ from selenium.webdriver.common.by import By
 from loguru import logger
 from tqdm import tqdm
 
-from dury.utils import download
+from dury.pipeline import DownloadResult, download_pipelined
+from dury.records import SLOTS
+from dury.sink import RecordSink
+from dury.store import ContentStore
+from dury.utils import download_many
 from dury.crawler.base import SeleniumCrawler
+from dury.crawler.checkpoint import Checkpoint
+from dury.crawler.history import CrawlHistory
+from dury.crawler.wait import element_count_at_least, window_count_grew
+from dury.crawler.profile import PROFILES
+from dury.crawler.extract import SELECTORS, extract
 
 
-@dataclass
+@dataclass(**SLOTS)
 class Artwork:
     id: str
     url: str
@@ -27,8 +41,10 @@ class Artwork:
 
 
 class PixivCrawler(SeleniumCrawler):
+    PROFILE = PROFILES["pixiv"]
     LOGIN_URL = "https://accounts.pixiv.net/login"
     PIXIV_URL = "https://www.pixiv.net"
+    ARTWORK_API_URL = "https://www.pixiv.net/ajax/illust/{}"
     REQUEST_HEADERS = {
         "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36",
         "Referer": "https://www.pixiv.net/"
@@ -47,58 +63,106 @@ class PixivCrawler(SeleniumCrawler):
         self.__password = password
         self.cookie_file = cookie_file
 
+        self._cookies_mtime = None
+        self._cookies_lock = threading.Lock()
+
     def run_on_keyword(
         self,
         keyword: str, *,
         safe_mode: Optional[bool] = True,
         limit: Optional[int] = 100, 
-        retry: Optional[int] = 5
+        retry: Optional[int] = 5,
+        num_workers: Optional[int] = 1,
+        fast: Optional[bool] = False,
+        checkpoint_file: Optional[str] = None
     ) -> List[Artwork]:
-        driver = self._launch()
-
-        try:
+        with self._driver() as driver:
             url = f"{self.PIXIV_URL}/tags/{keyword}/illustrations"
             if safe_mode:
                 url += "?mode=safe"
 
-            artwork_urls = self.get_artwork_urls(driver, url, limit=limit)
-            artworks = self.collect_artworks(driver, artwork_urls, limit=limit, retry=retry)
-            return artworks
-        finally:
-            driver.quit()
+            return self._crawl(
+                driver, url,
+                limit=limit, retry=retry,
+                num_workers=num_workers, fast=fast,
+                checkpoint_file=checkpoint_file
+            )
+
+    def stream_on_keyword(
+        self,
+        keyword: str, *,
+        safe_mode: Optional[bool] = True,
+        limit: Optional[int] = 100,
+        retry: Optional[int] = 5,
+        fast: Optional[bool] = False,
+        output_dir: Optional[str] = "output/pixiv",
+        num_workers: Optional[int] = 10,
+        buffer_size: Optional[int] = 100,
+        store: Optional[ContentStore] = None
+    ) -> Iterator[DownloadResult]:
+        os.makedirs(output_dir, exist_ok=True)
+
+        def scrape():
+            with self._driver() as driver:
+                url = f"{self.PIXIV_URL}/tags/{keyword}/illustrations"
+                if safe_mode:
+                    url += "?mode=safe"
+
+                artwork_urls = self.iter_artwork_urls(driver, url, limit=limit)
+                artworks = self.iter_artworks(driver, artwork_urls, retry=retry, fast=fast)
+                for artwork in artworks:
+                    for image_url in artwork.image_urls:
+                        yield image_url, os.path.join(output_dir, image_url.split("/")[-1])
+
+        return download_pipelined(
+            scrape(),
+            num_workers=num_workers,
+            buffer_size=buffer_size,
+            headers=self.REQUEST_HEADERS,
+            session_pool=self._session_pool,
+            store=store,
+            metrics=self.metrics
+        )
 
     def run_on_id(
         self,
         user_id: str, *,
         limit: Optional[int] = 100,
-        retry: Optional[int] = 5
+        retry: Optional[int] = 5,
+        num_workers: Optional[int] = 1,
+        fast: Optional[bool] = False,
+        checkpoint_file: Optional[str] = None,
+        history_file: Optional[str] = None
     ) -> List[Artwork]:
-        driver = self._launch()
-
-        try:
+        with self._driver() as driver:
             url = f"{self.PIXIV_URL}/users/{user_id}/illustrations"
-            artwork_urls = self.get_artwork_urls(driver, url, limit=limit)
-            artworks = self.collect_artworks(driver, artwork_urls, limit=limit, retry=retry)
-            return artworks
-        finally:
-            driver.quit()
+            return self._crawl(
+                driver, url,
+                limit=limit, retry=retry,
+                num_workers=num_workers, fast=fast,
+                checkpoint_file=checkpoint_file,
+                history_file=history_file, target=f"id:{user_id}"
+            )
 
     def run_on_user(
         self,
         username: str, *,
         limit: Optional[int] = 100,
-        retry: Optional[int] = 5
+        retry: Optional[int] = 5,
+        num_workers: Optional[int] = 1,
+        fast: Optional[bool] = False,
+        checkpoint_file: Optional[str] = None,
+        history_file: Optional[str] = None
     ) -> List[Artwork]:
-        driver = self._launch()
-
-        try:
+        with self._driver() as driver:
             driver.get(f"{self.PIXIV_URL}/search_user.php?nick={username}&s_mode=s_usr")
 
             # Go to top user page
             target = driver.find_elements(By.CLASS_NAME, "user-recommendation-item")[0]
             target = target.find_element(By.CLASS_NAME, "title")
+            new_tab_opened = window_count_grew(driver)
             target.click()
-            self._delay()
+            self._wait(driver, "pixiv_user_tab", new_tab_opened)
 
             # New tab is created after link to user page is clicked
             last_tab = driver.window_handles[-1]
@@ -108,52 +172,346 @@ class PixivCrawler(SeleniumCrawler):
             driver.switch_to.window(window_name=last_tab)
 
             url = f"{driver.current_url}/illustrations"
-            artwork_urls = self.get_artwork_urls(driver, url, limit=limit)
-            artworks = self.collect_artworks(driver, artwork_urls, limit=limit, retry=retry)
-            return artworks
+            return self._crawl(
+                driver, url,
+                limit=limit, retry=retry,
+                num_workers=num_workers, fast=fast,
+                checkpoint_file=checkpoint_file,
+                history_file=history_file, target=f"user:{username}"
+            )
+
+    def _crawl(
+        self,
+        driver: Chrome,
+        illustration_url: str, *,
+        limit: Optional[int] = 100,
+        retry: Optional[int] = 5,
+        num_workers: Optional[int] = 1,
+        fast: Optional[bool] = False,
+        checkpoint_file: Optional[str] = None,
+        history_file: Optional[str] = None,
+        target: Optional[str] = None
+    ) -> List[Artwork]:
+        # Only artworks newer than the ones seen on the previous run are listed
+        history = CrawlHistory(history_file) if history_file is not None else None
+        known = history.known(target) if history is not None else None
+
+        checkpoint = Checkpoint(checkpoint_file) if checkpoint_file is not None else None
+        try:
+            artwork_urls = checkpoint.urls if checkpoint is not None else None
+            if artwork_urls is None:
+                artwork_urls = self.get_artwork_urls(driver, illustration_url, limit=limit, known=known)
+                if checkpoint is not None:
+                    checkpoint.save_urls(artwork_urls)
+
+            artworks = self.collect_artworks(
+                driver, artwork_urls,
+                limit=limit, retry=retry,
+                num_workers=num_workers, fast=fast,
+                checkpoint=checkpoint
+            )
+            if checkpoint is not None:
+                checkpoint.complete()
         finally:
-            driver.quit()
+            if checkpoint is not None:
+                checkpoint.close()
+
+        if history is not None:
+            history.update(target, [ artwork.id for artwork in artworks if artwork.image_urls ])
+        return artworks
 
     def get_artwork_urls(
         self,
         driver: Chrome,
         illustration_url: str, *,
         limit: Optional[int] = 100,
-        artwork_urls: Optional[List[str]] = []
+        known: Optional[Set[str]] = None
     ) -> List[str]:
-        driver.get(illustration_url)
-        self._delay()
+        return list(self.iter_artwork_urls(driver, illustration_url, limit=limit, known=known))
 
-        image_cards = self._find_cards(driver)
-
-        if len(image_cards) > 0:
-            artwork_urls += [
-                image_card.find_element(By.TAG_NAME, "a").get_attribute("href")
-                for image_card in image_cards
-            ]
-
-            if len(artwork_urls) < limit:
+    def iter_artwork_urls(
+        self,
+        driver: Chrome,
+        illustration_url: str, *,
+        limit: Optional[int] = 100,
+        known: Optional[Set[str]] = None
+    ) -> Iterator[str]:
+        # Each page is read in full before its urls are yielded, so the caller
+        # may use the same driver for the artworks in between pages
+        num_urls = 0
+        page_url = illustration_url
+        while page_url is not None and num_urls < limit:
+            driver.get(page_url)
+            self._wait(driver, "pixiv_artwork_list", element_count_at_least("section li a"))
+
+            image_cards = self._find_cards(driver)
+            if len(image_cards) == 0:
+                return
+
+            page_urls = []
+            reached_known = False
+            for image_card in image_cards[:limit - num_urls]:
+                artwork_url = image_card.find_element(By.TAG_NAME, "a").get_attribute("href")
+                # Artworks are listed newest first, so the first known one
+                # marks where the previous run started
+                if known is not None and self._artwork_id(artwork_url) in known:
+                    reached_known = True
+                    break
+                page_urls.append(artwork_url)
+
+            next_page = None
+            if not reached_known and num_urls + len(page_urls) < limit:
                 next_page = self._get_next_page(driver)
-                return self.get_artwork_urls(driver, next_page, limit=limit, artwork_urls=artwork_urls)
+                if next_page == page_url:
+                    next_page = None
 
-        # free cache memory before return for next run
-        tmp = copy.deepcopy(artwork_urls)
-        artwork_urls.clear() 
-        return tmp
+            for artwork_url in page_urls:
+                num_urls += 1
+                yield artwork_url
+            page_url = next_page
 
     def collect_artworks(
         self,
         driver: Chrome,
         artwork_urls: List[str], *,
         limit: Optional[int] = 100,
-        retry: Optional[int] = 5
+        retry: Optional[int] = 5,
+        num_workers: Optional[int] = 1,
+        fast: Optional[bool] = False,
+        checkpoint: Optional[Checkpoint] = None,
+        sink: Optional[RecordSink] = None
+    ) -> Union[List[Artwork], int]:
+        artwork_urls = artwork_urls[:limit]
+        remaining_urls = artwork_urls
+        if checkpoint is not None:
+            remaining_urls = [ url for url in artwork_urls if not checkpoint.done(url) ]
+            logger.info(f"Resume with {len(remaining_urls)} of {len(artwork_urls)} artworks left")
+
+        if sink is not None:
+            # Records go straight to the sink and are not kept, so the
+            # number of written artworks is returned instead
+            if checkpoint is not None:
+                for url in artwork_urls:
+                    if checkpoint.done(url):
+                        sink.write(Artwork(**checkpoint.get(url)))
+
+            if num_workers > 1:
+                self._collect_artworks_parallel(
+                    driver, remaining_urls,
+                    retry=retry, num_workers=num_workers, fast=fast,
+                    checkpoint=checkpoint, sink=sink
+                )
+            else:
+                sink.write_many(self.iter_artworks(
+                    driver, tqdm(remaining_urls),
+                    retry=retry, fast=fast, checkpoint=checkpoint
+                ))
+            sink.flush()
+            return len(artwork_urls)
+
+        if num_workers > 1:
+            artworks = self._collect_artworks_parallel(
+                driver, remaining_urls,
+                retry=retry, num_workers=num_workers, fast=fast,
+                checkpoint=checkpoint
+            )
+        else:
+            artworks = list(self.iter_artworks(
+                driver, tqdm(remaining_urls),
+                retry=retry, fast=fast, checkpoint=checkpoint
+            ))
+
+        if checkpoint is None:
+            return artworks
+
+        collected = dict(zip(remaining_urls, artworks))
+        return [
+            collected[url] if url in collected else Artwork(**checkpoint.get(url))
+            for url in artwork_urls
+        ]
+
+    def iter_artworks(
+        self,
+        driver: Chrome,
+        artwork_urls: Iterable[str], *,
+        retry: Optional[int] = 5,
+        fast: Optional[bool] = False,
+        checkpoint: Optional[Checkpoint] = None
+    ) -> Iterator[Artwork]:
+        for artwork_url in artwork_urls:
+            yield self._collect_artwork(
+                driver, artwork_url,
+                retry=retry, fast=fast, checkpoint=checkpoint
+            )
+
+    def _collect_artworks_parallel(
+        self,
+        driver: Chrome,
+        artwork_urls: List[str], *,
+        retry: Optional[int] = 5,
+        num_workers: Optional[int] = 2,
+        fast: Optional[bool] = False,
+        checkpoint: Optional[Checkpoint] = None,
+        sink: Optional[RecordSink] = None
     ) -> List[Artwork]:
-        artworks = []
-        for artwork_url in tqdm(artwork_urls[:limit]):
-            artwork = self.get_artwork(driver, artwork_url, retry=retry)
-            artworks.append(artwork)
+        # Artwork pages are independent, so they are shared out to several
+        # browsers through a queue and put back in place by index
+        tasks = Queue()
+        for i, artwork_url in enumerate(artwork_urls):
+            tasks.put((i, artwork_url, 0))
+
+        artworks = [ None ] * len(artwork_urls)
+        finished = [ False ] * len(artwork_urls)
+        progress = tqdm(total=len(artwork_urls))
+
+        def finish(index: int, artwork: Artwork):
+            finished[index] = True
+            if sink is not None:
+                sink.write(artwork)
+            else:
+                artworks[index] = artwork
+            progress.update(1)
+
+        placeholders = []
+
+        def placeholder(artwork_url: str) -> Artwork:
+            placeholders.append(artwork_url)
+            self.metrics.inc("placeholders", site="pixiv")
+            return Artwork(self._artwork_id(artwork_url), artwork_url)
+
+        def work(worker_driver: Chrome) -> bool:
+            # Returns whether the browser broke down and needs replacing
+            while True:
+                try:
+                    index, artwork_url, attempts = tasks.get_nowait()
+                except Empty:
+                    return False
+                try:
+                    finish(index, self._collect_artwork(
+                        worker_driver, artwork_url,
+                        retry=retry, fast=fast, checkpoint=checkpoint
+                    ))
+                except Exception as e:
+                    self.metrics.inc("errors", stage="pixiv_artwork")
+                    logger.error(e)
+                    if attempts < retry:
+                        tasks.put((index, artwork_url, attempts + 1))
+                    else:
+                        finish(index, placeholder(artwork_url))
+                    if not self._is_alive(worker_driver):
+                        return True
+
+        def extra_work():
+            # A broken browser is handed back and a fresh one leased, up to
+            # retry times, before the worker leaves the rest to the others
+            for _ in range(retry + 1):
+                try:
+                    # Extra browsers load the saved login cookies in _launch
+                    with self._driver(timeout=1.0) as worker_driver:
+                        if not work(worker_driver):
+                            return
+                except Empty:
+                    return
+                except Exception as e:
+                    self.metrics.inc("errors", stage="pixiv_worker")
+                    logger.error(e)
+
+        try:
+            with ThreadPoolExecutor(max_workers=num_workers - 1) as executor:
+                for _ in range(num_workers - 1):
+                    executor.submit(extra_work)
+                if work(driver):
+                    extra_work()
+
+            for i, artwork_url in enumerate(artwork_urls):
+                if not finished[i]:
+                    finish(i, placeholder(artwork_url))
+        finally:
+            progress.close()
+
+        if placeholders:
+            logger.warning(f"{len(placeholders)} of {len(artwork_urls)} artworks could not be collected")
         return artworks
 
+    def _is_alive(self, driver: Chrome) -> bool:
+        try:
+            driver.current_url
+            return True
+        except Exception as e:
+            logger.info(e)
+            return False
+
+    def _artwork_id(self, artwork_url: str) -> str:
+        return urlparse(artwork_url).path.split("/")[-1]
+
+    def _collect_artwork(
+        self,
+        driver: Chrome,
+        artwork_url: str, *,
+        retry: Optional[int] = 5,
+        fast: Optional[bool] = False,
+        checkpoint: Optional[Checkpoint] = None
+    ) -> Artwork:
+        artwork = None
+        if fast:
+            try:
+                artwork = self.get_artwork_http(artwork_url)
+            except Exception as e:
+                logger.info(e)
+        if artwork is None:
+            artwork = self.get_artwork(driver, artwork_url, retry=retry)
+
+        # Artworks that failed to load are left for the next run
+        if checkpoint is not None and artwork.image_urls:
+            checkpoint.record(artwork_url, asdict(artwork))
+        return artwork
+
+    def get_artwork_http(self, artwork_url: str, *, timeout: Optional[float] = 10) -> Artwork:
+        # Reads the same fields as get_artwork from the JSON endpoints behind the
+        # artwork page, authenticated with the cookies saved after login
+        artwork_id = self._artwork_id(artwork_url)
+        session = self._http_session()
+
+        api_url = self.ARTWORK_API_URL.format(artwork_id)
+        illust = self._get_json(session, api_url, timeout=timeout)
+        pages = self._get_json(session, f"{api_url}/pages", timeout=timeout)
+
+        title = illust.get("title", "")
+        desc = self._html_to_text(illust.get("description") or illust.get("illustComment") or "")
+        tags = [ tag["tag"] for tag in illust.get("tags", {}).get("tags", []) ]
+        image_urls = [ page["urls"]["regular"] for page in pages ]
+        return Artwork(artwork_id, artwork_url, title, desc, image_urls, tags)
+
+    def _http_session(self) -> requests.Session:
+        session = self._session_pool.get(self.PIXIV_URL)
+
+        # Pick up cookies again whenever a new login rewrote the file
+        with self._cookies_lock:
+            if os.path.exists(self.cookie_file):
+                mtime = os.path.getmtime(self.cookie_file)
+                if mtime != self._cookies_mtime:
+                    with open(self.cookie_file, "r") as f:
+                        cookies = json.load(f)
+                    for cookie in cookies:
+                        session.cookies.set(
+                            cookie["name"], cookie["value"],
+                            domain=cookie.get("domain"), path=cookie.get("path", "/")
+                        )
+                    self._cookies_mtime = mtime
+        return session
+
+    def _get_json(self, session: requests.Session, url: str, *, timeout: Optional[float] = 10):
+        res = session.get(url, headers=self.REQUEST_HEADERS, timeout=timeout)
+        data = res.json()
+        if res.status_code != 200 or data.get("error"):
+            raise IOError(f"Failed to fetch {url}: {data.get('message')}")
+        return data["body"]
+
+    def _html_to_text(self, text: str) -> str:
+        text = re.sub(r"<br\s*/?>", "\n", text)
+        text = re.sub(r"<[^>]+>", "", text)
+        return html.unescape(text)
+
     def get_artwork(
         self,
         driver: Chrome,
@@ -165,33 +523,16 @@ class PixivCrawler(SeleniumCrawler):
         artwork_id = urlparse(driver.current_url).path.split("/")[-1]
 
         try:
-            figure = self._explicitly_wait(driver, 5, EC.visibility_of_element_located((By.TAG_NAME, "figure")))
-            body = driver.find_element(By.TAG_NAME, "figcaption")
-            
-            try:
-                title_element = body.find_element(By.TAG_NAME, "h1")
-                title = title_element.text
-            except Exception as e:
-                logger.error(e)
-                title = ""
-
-            try:
-                desc_element = body.find_element(By.TAG_NAME, "p")
-                desc = desc_element.text
-            except Exception as e:
-                logger.error(e)
-                desc = ""
-
-            try:
-                tag_body = body.find_element(By.TAG_NAME, "footer")
-                tag_elements = tag_body.find_elements(By.TAG_NAME, "a")
-                tags = [ tag_element.text for tag_element in tag_elements]
-            except Exception as e:
-                logger.error(e)
-                tags = []
-
-            image_elements = figure.find_elements(By.TAG_NAME, "img")
-            image_urls = [ image_element.get_attribute("src") for image_element in image_elements ]
+            self._explicitly_wait(driver, 5, EC.visibility_of_element_located((By.TAG_NAME, "figure")))
+            fields = extract(driver, SELECTORS["pixiv_artwork"])
+            caption = fields["caption"]
+            if caption is None:
+                raise ValueError("Artwork caption is not loaded")
+
+            title = caption["title"] or ""
+            desc = caption["desc"] or ""
+            tags = caption["tags"]
+            image_urls = fields["figure"]["image_urls"]
             return Artwork(artwork_id, artwork_url, title, desc, image_urls, tags)
         except Exception as e:
             if retry > 0:
@@ -204,29 +545,33 @@ class PixivCrawler(SeleniumCrawler):
         artworks: List[Artwork], *,
         output_dir: Optional[str] = "output/pixiv",
         num_workers: Optional[int] = 10,
+        engine: Optional[str] = "thread",
+        store: Optional[ContentStore] = None
     ):
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        image_urls = []
+        tasks = []
         for artwork in artworks:
-            image_urls += artwork.image_urls
-
-        task = lambda x: download(
-            x,
-            os.path.join(output_dir, x.split("/")[-1]),
-            headers=self.REQUEST_HEADERS
+            for image_url in artwork.image_urls:
+                tasks.append((image_url, os.path.join(output_dir, image_url.split("/")[-1])))
+
+        return download_many(
+            tasks,
+            engine=engine,
+            num_workers=num_workers,
+            headers=self.REQUEST_HEADERS,
+            session_pool=self._session_pool,
+            store=store,
+            metrics=self.metrics
         )
-        
-        with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            results = list(tqdm(executor.map(task, image_urls), total=len(image_urls)))
-        return results
 
     def _launch(self) -> Chrome:
         driver = super()._launch()
         status = self._load_cookies(driver, self.cookie_file, self.PIXIV_URL)
         if status < 0 and (self.__username and self.__password):
-            self._login(driver)
+            with self.metrics.timer("login", site="pixiv"):
+                self._login(driver)
         return driver
 
     def _setup(self, mode: str, target: str) -> str:
@@ -234,7 +579,7 @@ class PixivCrawler(SeleniumCrawler):
 
     def _login(self, driver: Chrome):
         driver.get(self.LOGIN_URL)
-        self._delay()
+        self._wait(driver, "pixiv_login_form", element_count_at_least("#container-login input[type='password']"))
 
         login_element = driver.find_element_by_xpath("//div[@id='container-login']")
         username_input_element = login_element.find_element_by_xpath(".//input[@type='text']")
@@ -267,6 +612,9 @@ class PixivCrawler(SeleniumCrawler):
 
     def _get_next_page(self, driver: Chrome):
         nav_links = driver.find_elements_by_xpath(".//a[contains(@href, '?p=') or contains(@href, '&p=')]")
+        # Galleries that fit on a single page have no pagination
+        if len(nav_links) == 0:
+            return None
         next_page = nav_links[-1].get_attribute("href")
         return next_page
 
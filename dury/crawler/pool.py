@@ -0,0 +1,176 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from queue import Queue, Empty
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlparse
+
+from selenium.webdriver import Chrome
+from loguru import logger
+
+from dury.metrics import default_metrics
+
+
+class PageCountingChrome(Chrome):
+    def __init__(self, *args, **kwargs) -> None:
+        super(PageCountingChrome, self).__init__(*args, **kwargs)
+        self.page_count = 0
+        self.metrics = default_metrics
+
+    def get(self, url: str) -> None:
+        self.page_count += 1
+        with self.metrics.timer("page_load", host=urlparse(url).netloc):
+            super(PageCountingChrome, self).get(url)
+
+
+class DriverPool:
+    POLL_INTERVAL = 0.5
+
+    def __init__(
+        self,
+        launch: Callable[[], Chrome], *,
+        size: Optional[int] = 2,
+        max_pages: Optional[int] = 100,
+        warm: Optional[bool] = True
+    ) -> None:
+        self._launch = launch
+        self.size = size
+        self.max_pages = max_pages
+
+        self._idle: Queue = Queue()
+        self._num_drivers = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        # The first launch logs in and saves the cookies the others reuse, so
+        # no launch runs alongside it
+        self._first_launch = threading.Lock()
+        self._launched = threading.Event()
+
+        if warm:
+            self._replenish()
+            with ThreadPoolExecutor(max_workers=size) as executor:
+                for _ in range(size - 1):
+                    executor.submit(self._replenish)
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator[Chrome]:
+        driver = self._acquire(timeout)
+        try:
+            yield driver
+        finally:
+            # Timeouts and missing elements raise too, so the browser itself
+            # is asked whether it is still alive before it is thrown away
+            self._release(driver)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except Empty:
+                break
+            self._quit(driver)
+
+    def _acquire(self, timeout: Optional[float] = None) -> Chrome:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            launch = False
+            with self._lock:
+                if self._closed:
+                    raise IOError("Driver pool is closed")
+                if self._idle.empty() and self._num_drivers < self.size:
+                    self._num_drivers += 1
+                    launch = True
+
+            if launch:
+                try:
+                    return self._new_driver()
+                except Exception:
+                    with self._lock:
+                        self._num_drivers -= 1
+                    raise
+
+            # Waiters wake up regularly to launch a browser themselves in
+            # case a background relaunch failed and none is on its way
+            wait = self.POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    raise Empty()
+            try:
+                driver = self._idle.get(timeout=wait)
+            except Empty:
+                continue
+            if self._is_healthy(driver):
+                return driver
+            self._quit(driver)
+
+    def _release(self, driver: Chrome) -> None:
+        recycle = getattr(driver, "page_count", 0) >= self.max_pages
+        if not self._closed and not recycle and self._is_healthy(driver) and self._reset(driver):
+            self._idle.put(driver)
+            return
+
+        self._quit(driver)
+        if not self._closed:
+            # Keep the pool warm by launching the replacement in the background
+            threading.Thread(target=self._replenish, daemon=True).start()
+
+    def _new_driver(self) -> Chrome:
+        if not self._launched.is_set():
+            with self._first_launch:
+                if not self._launched.is_set():
+                    driver = self._launch()
+                    self._launched.set()
+                    return driver
+        return self._launch()
+
+    def _replenish(self) -> None:
+        with self._lock:
+            if self._closed or self._num_drivers >= self.size:
+                return
+            self._num_drivers += 1
+
+        try:
+            driver = self._new_driver()
+        except Exception as e:
+            logger.error(e)
+            with self._lock:
+                self._num_drivers -= 1
+            return
+
+        if self._closed:
+            self._quit(driver)
+        else:
+            self._idle.put(driver)
+
+    def _is_healthy(self, driver: Chrome) -> bool:
+        try:
+            driver.current_url
+            return True
+        except Exception as e:
+            logger.info(e)
+            return False
+
+    def _reset(self, driver: Chrome) -> bool:
+        # Close tabs opened during the run so the next lease starts from one window
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            return True
+        except Exception as e:
+            logger.info(e)
+            return False
+
+    def _quit(self, driver: Chrome) -> None:
+        with self._lock:
+            self._num_drivers -= 1
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.info(e)
@@ -0,0 +1,68 @@
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any
+
+from selenium import webdriver
+from selenium.webdriver import Chrome
+
+
+FONT_PATTERNS = ["*.woff", "*.woff2", "*.ttf", "*.otf"]
+MEDIA_PATTERNS = ["*.mp4", "*.webm", "*.m3u8", "*.mp3"]
+TRACKER_PATTERNS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*googlesyndication.com*",
+    "*connect.facebook.net*",
+    "*scorecardresearch.com*"
+]
+
+
+@dataclass
+class BrowserProfile:
+    block_images: Optional[bool] = False
+    block_patterns: Optional[List[str]] = field(default_factory=list)
+    page_load_strategy: Optional[str] = "normal"
+    prefs: Optional[Dict[str, Any]] = field(default_factory=dict)
+
+    def apply(self, options: webdriver.ChromeOptions) -> Dict[str, Any]:
+        prefs = dict(self.prefs)
+        if self.block_images:
+            options.add_argument("--blink-settings=imagesEnabled=false")
+            prefs["profile.managed_default_content_settings.images"] = 2
+        if prefs:
+            options.add_experimental_option("prefs", prefs)
+        return { "pageLoadStrategy": self.page_load_strategy }
+
+    def install(self, driver: Chrome) -> None:
+        # URL blocking lives in DevTools, so it has to be set on the running browser
+        if self.block_patterns:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", { "urls": self.block_patterns })
+
+
+DEFAULT_PROFILE = BrowserProfile()
+
+# Only URLs and text are read from the DOM, so nothing a renderer would
+# fetch after the markup is needed. Google previews swap their full-size
+# source in after the image loads, so images stay enabled there.
+PROFILES = {
+    "google": BrowserProfile(
+        block_patterns=FONT_PATTERNS + MEDIA_PATTERNS + TRACKER_PATTERNS,
+        page_load_strategy="eager"
+    ),
+    "naver": BrowserProfile(
+        block_images=True,
+        block_patterns=FONT_PATTERNS + MEDIA_PATTERNS + TRACKER_PATTERNS,
+        page_load_strategy="eager"
+    ),
+    "instagram": BrowserProfile(
+        block_images=True,
+        block_patterns=FONT_PATTERNS + MEDIA_PATTERNS + TRACKER_PATTERNS,
+        page_load_strategy="eager"
+    ),
+    "pixiv": BrowserProfile(
+        block_images=True,
+        block_patterns=FONT_PATTERNS + MEDIA_PATTERNS + TRACKER_PATTERNS,
+        page_load_strategy="eager"
+    )
+}
@@ -0,0 +1,177 @@
+import time
+from typing import Optional, Dict, Any, Iterator, List
+
+from selenium.webdriver import Chrome
+
+from .extract import EXTRACT_FUNCTIONS
+from dury.metrics import default_metrics
+
+
+# Nodes matching the selector are queued once, when they first enter the DOM,
+# so every poll only extracts what was appended since the previous one
+INSTALL_SCRIPT = """
+const selector = arguments[0];
+if (window.__duryHarvest) window.__duryHarvest.observer.disconnect();
+
+const state = { queue: [], seen: new WeakSet(), last: Date.now() };
+const push = node => {
+    if (state.seen.has(node)) return;
+    state.seen.add(node);
+    state.queue.push(node);
+    state.last = Date.now();
+};
+const scan = node => {
+    if (node.nodeType !== Node.ELEMENT_NODE) return;
+    if (node.matches(selector)) push(node);
+    node.querySelectorAll(selector).forEach(push);
+};
+
+document.querySelectorAll(selector).forEach(push);
+state.observer = new MutationObserver(records => {
+    for (const record of records) record.addedNodes.forEach(scan);
+});
+state.observer.observe(document.body, { childList: true, subtree: true });
+window.__duryHarvest = state;
+"""
+
+POLL_SCRIPT = EXTRACT_FUNCTIONS + """
+const fields = arguments[0];
+const timeout = arguments[1];
+const settle = arguments[2];
+const done = arguments[arguments.length - 1];
+const state = window.__duryHarvest;
+if (!state) return done(null);
+
+const started = Date.now();
+(function wait() {
+    const now = Date.now();
+    // Return once new nodes stopped arriving for a moment, or give up on timeout
+    if ((state.queue.length > 0 && now - state.last >= settle) || now - started >= timeout) {
+        const nodes = state.queue.splice(0, state.queue.length);
+        done({ records: nodes.map(node => extract(node, fields)), waited: now - started });
+    } else {
+        setTimeout(wait, 25);
+    }
+})();
+"""
+
+CLICK_SCRIPT = """
+const button = document.querySelector(arguments[0]);
+if (!button) return false;
+button.click();
+return true;
+"""
+
+UNINSTALL_SCRIPT = """
+if (window.__duryHarvest) {
+    window.__duryHarvest.observer.disconnect();
+    delete window.__duryHarvest;
+}
+"""
+
+
+class ScrollHarvester:
+    def __init__(
+        self,
+        driver: Chrome,
+        selector: str,
+        fields: Dict[str, Any], *,
+        more_selector: Optional[str] = None,
+        timeout: Optional[float] = 2.0,
+        min_timeout: Optional[float] = 0.5,
+        settle: Optional[float] = 0.1,
+        adaptive: Optional[bool] = True,
+        interval: Optional[float] = 0.0
+    ) -> None:
+        self.driver = driver
+        self.selector = selector
+        self.fields = fields
+        self.more_selector = more_selector
+        self.timeout = timeout
+        self.min_timeout = min_timeout
+        self.settle = settle
+        self.adaptive = adaptive
+        self.interval = interval
+        self._latency = None
+        self._last_advance = None
+
+    def poll(self) -> List[Dict[str, Any]]:
+        metrics = getattr(self.driver, "metrics", default_metrics)
+        with metrics.timer("scroll_poll", selector=self.selector):
+            res = self.driver.execute_async_script(
+                POLL_SCRIPT, self.fields, int(self._poll_timeout() * 1000), int(self.settle * 1000)
+            )
+        if res is None:
+            raise IOError("Harvester is not installed on the current page")
+        metrics.inc("scroll_items", len(res["records"]), selector=self.selector)
+
+        self._observe(res["waited"] / 1000, len(res["records"]) > 0)
+        return res["records"]
+
+    def _poll_timeout(self) -> float:
+        # Wait a few times as long as new content has been taking to arrive,
+        # instead of always waiting for the worst case
+        if not self.adaptive or self._latency is None:
+            return self.timeout
+        return min(self.timeout, max(self.min_timeout, 3 * self._latency))
+
+    def _advance_interval(self) -> float:
+        # Content is not requested faster than it has been arriving, with
+        # interval as the floor
+        if not self.adaptive or self._latency is None:
+            return self.interval
+        return max(self.interval, self._latency)
+
+    def _observe(self, waited: float, arrived: bool) -> None:
+        if not arrived:
+            # Back off after an empty poll so a slow response is not missed twice
+            if self._latency is not None:
+                self._latency = min(self.timeout, self._latency * 2)
+        elif self._latency is None:
+            self._latency = waited
+        else:
+            self._latency = 0.7 * self._latency + 0.3 * waited
+
+    def advance(self) -> bool:
+        # Time spent waiting for content counts towards the interval, so it
+        # only caps how often new content is requested
+        if self._last_advance is not None:
+            remaining = self._advance_interval() - (time.monotonic() - self._last_advance)
+            if remaining > 0:
+                time.sleep(remaining)
+        self._last_advance = time.monotonic()
+
+        if self.more_selector is not None:
+            return self.driver.execute_script(CLICK_SCRIPT, self.more_selector)
+        self.scroll()
+        return True
+
+    def scroll(self) -> None:
+        self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+
+    def harvest(
+        self, *,
+        limit: Optional[int] = 10000,
+        max_retry: Optional[int] = 5
+    ) -> Iterator[Dict[str, Any]]:
+        self.driver.set_script_timeout(self.timeout + 10)
+        self.driver.execute_script(INSTALL_SCRIPT, self.selector)
+
+        num_items = 0
+        retry_cnt = max_retry
+        try:
+            while retry_cnt > 0 and num_items < limit:
+                records = self.poll()
+                if records:
+                    retry_cnt = max_retry
+                else:
+                    retry_cnt -= 1
+
+                for record in records[:limit - num_items]:
+                    num_items += 1
+                    yield record
+                # A missing "more" button means everything is loaded
+                if num_items >= limit or not self.advance():
+                    break
+        finally:
+            self.driver.execute_script(UNINSTALL_SCRIPT)
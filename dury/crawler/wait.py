@@ -0,0 +1,74 @@
+import threading
+from collections import deque
+from typing import Optional, Callable, Dict, Any, Tuple
+
+from selenium.webdriver import Chrome
+
+from .extract import count
+
+
+Condition = Callable[[Chrome], Any]
+
+
+def document_ready() -> Condition:
+    # Eager page loads stop at "interactive", so anything past "loading" counts
+    return lambda driver: driver.execute_script("return document.readyState;") != "loading"
+
+
+def network_idle(quiet: Optional[float] = 0.5) -> Condition:
+    script = """
+    if (document.readyState === "loading") return false;
+    const entries = performance.getEntriesByType("resource");
+    const last = entries.reduce((t, e) => Math.max(t, e.responseEnd), 0);
+    return performance.now() - last >= arguments[0];
+    """
+    return lambda driver: driver.execute_script(script, quiet * 1000)
+
+
+def element_count_at_least(selector: str, num: Optional[int] = 1) -> Condition:
+    return lambda driver: count(driver, selector) >= num
+
+
+def element_count_grew(driver: Chrome, selector: str) -> Condition:
+    return element_count_at_least(selector, count(driver, selector) + 1)
+
+
+def window_count_grew(driver: Chrome) -> Condition:
+    num_windows = len(driver.window_handles)
+    return lambda driver: len(driver.window_handles) > num_windows
+
+
+def all_of(*conditions: Condition) -> Condition:
+    return lambda driver: all(condition(driver) for condition in conditions)
+
+
+class WaitEngine:
+    def __init__(self, *, history: Optional[int] = 20) -> None:
+        self.history = history
+        self._latencies: Dict[str, deque] = {}
+        self._saved: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def bounds(self, name: str, baseline: float) -> Tuple[float, float]:
+        # Polling starts shortly before the fastest time the step has been
+        # ready in, and gives up a good margin past the slowest one. Until
+        # there are samples the fixed delay it replaces is doubled.
+        with self._lock:
+            latencies = list(self._latencies.get(name, []))
+        if not latencies:
+            return 0.0, 2 * baseline
+
+        min_wait = 0.5 * min(latencies)
+        max_wait = min(2 * baseline, max(baseline / 2, 2 * max(latencies)))
+        return min_wait, max(min_wait, max_wait)
+
+    def record(self, name: str, elapsed: float, baseline: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(name, deque(maxlen=self.history)).append(elapsed)
+            self._saved[name] = self._saved.get(name, 0.0) + baseline - elapsed
+
+    def saved(self, name: Optional[str] = None) -> float:
+        with self._lock:
+            if name is not None:
+                return self._saved.get(name, 0.0)
+            return sum(self._saved.values())
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Metrics:
+    def __init__(self, *, prefix: Optional[str] = "dury") -> None:
+        self.prefix = prefix
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        # Gauges hold values that can go down as well as up
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        # Timings are kept as count, sum and max, which is all a Prometheus
+        # summary without quantiles needs
+        self._timings: Dict[str, Dict[Labels, List[float]]] = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def inc(self, name: str, value: Optional[float] = 1, **labels: Any) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        key = self._labels(labels)
+        with self._lock:
+            timing = self._timings.setdefault(name, {}).setdefault(key, [ 0, 0.0, 0.0 ])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, **labels)
+
+    def _labels(self, labels: Dict[str, Any]) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f"{self.prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+
+            for name, series in sorted(self._gauges.items()):
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+
+            for name, series in sorted(self._timings.items()):
+                metric = f"{self.prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} summary")
+                for labels, (num, total, _) in sorted(series.items()):
+                    lines.append(f"{metric}_count{_format_labels(labels)} {num}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"# TYPE {metric}_max gauge")
+                for labels, (_, _, longest) in sorted(series.items()):
+                    lines.append(f"{metric}_max{_format_labels(labels)} {longest:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        # Written aside and renamed, so a node exporter never reads half a file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def serve(self, port: Optional[int] = 9464, host: Optional[str] = "127.0.0.1") -> None:
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def summary(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._timings.items()):
+                for labels, (num, total, longest) in sorted(series.items()):
+                    lines.append(
+                        f"{name}{_format_labels(labels)}: {num} x {total / num:.3f}s avg, "
+                        f"{longest:.3f}s max, {total:.1f}s total"
+                    )
+            for name, series in sorted(self._counters.items()) + sorted(self._gauges.items()):
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(labels)}: {_format_value(value)}")
+
+            # Throughput is the one figure that needs two series
+            num_bytes = sum(self._counters.get("download_bytes", {}).values())
+            seconds = sum(timing[1] for timing in self._timings.get("download", {}).values())
+            if num_bytes and seconds:
+                lines.append(f"download throughput: {num_bytes / seconds / 1024 / 1024:.2f} MiB/s per worker")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    values = ",".join(
+        '{}="{}"'.format(key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + values + "}"
+
+
+default_metrics = Metrics()
@@ -0,0 +1,118 @@
+import threading
+from dataclasses import dataclass
+from queue import Queue, Empty, Full
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from tqdm import tqdm
+
+from dury.metrics import Metrics
+from dury.session import SessionPool
+from dury.store import ContentStore
+from dury.utils import DEFAULT_HEADER, download
+
+
+_DONE = object()
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    output_path: str
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def download_pipelined(
+    tasks: Iterable[Tuple[str, str]], *,
+    num_workers: Optional[int] = 10,
+    buffer_size: Optional[int] = 100,
+    headers: Optional[Dict[str, str]] = DEFAULT_HEADER,
+    timeout: Optional[int] = None,
+    retry: Optional[int] = 5,
+    session_pool: Optional[SessionPool] = None,
+    store: Optional[ContentStore] = None,
+    metrics: Optional[Metrics] = None
+) -> Iterator[DownloadResult]:
+    # Tasks are drawn from the iterable by a background thread into a bounded
+    # queue, so downloads start while the scraper behind it is still running
+    # and the scraper is held back when downloads fall too far behind.
+    pending: Queue = Queue(maxsize=buffer_size)
+    results: Queue = Queue()
+    stop = threading.Event()
+
+    if session_pool is not None:
+        session_pool.resize(num_workers)
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce() -> None:
+        iterator = iter(tasks)
+        try:
+            for task in iterator:
+                if not put(task):
+                    break
+        except Exception as e:
+            results.put(e)
+        finally:
+            # Let a generator release its browser in the thread that ran it
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            put(_DONE)
+
+    def consume() -> None:
+        try:
+            while not stop.is_set():
+                try:
+                    task = pending.get(timeout=0.1)
+                except Empty:
+                    continue
+                if task is _DONE:
+                    # Pass the marker on to the next worker
+                    put(_DONE)
+                    return
+
+                url, output_path = task
+                try:
+                    download(
+                        url, output_path,
+                        headers=headers, timeout=timeout,
+                        retry=retry, session_pool=session_pool, store=store, metrics=metrics
+                    )
+                    results.put(DownloadResult(url, output_path))
+                except Exception as e:
+                    results.put(DownloadResult(url, output_path, e))
+        finally:
+            results.put(_DONE)
+
+    threads = [ threading.Thread(target=produce, daemon=True) ]
+    threads += [ threading.Thread(target=consume, daemon=True) for _ in range(num_workers) ]
+    for thread in threads:
+        thread.start()
+
+    progress = tqdm()
+    num_running = num_workers
+    try:
+        while num_running > 0:
+            result = results.get()
+            if result is _DONE:
+                num_running -= 1
+                continue
+            if isinstance(result, Exception):
+                raise result
+
+            progress.update(1)
+            yield result
+    finally:
+        stop.set()
+        progress.close()
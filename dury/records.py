@@ -0,0 +1,155 @@
+import sys
+from array import array
+from dataclasses import fields, is_dataclass
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Union, get_type_hints
+
+try:
+    from typing import get_origin, get_args
+except ImportError:
+    get_origin = lambda tp: getattr(tp, "__origin__", None)
+    get_args = lambda tp: getattr(tp, "__args__", ())
+
+
+# Slotted dataclasses drop the per-instance __dict__, which is most of the
+# footprint of a small record. Older interpreters fall back to plain ones.
+SLOTS = { "slots": True } if sys.version_info >= (3, 10) else {}
+
+
+class StringTable:
+    def __init__(self) -> None:
+        self.values: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def index(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = len(self.values)
+            self._ids[value] = string_id
+            self.values.append(sys.intern(value))
+        return string_id
+
+    def get(self, string_id: int) -> Optional[str]:
+        return None if string_id < 0 else self.values[string_id]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class RecordBatch:
+    def __init__(self, record_type: type, *, strings: Optional[StringTable] = None) -> None:
+        assert is_dataclass(record_type), "Record type must be a dataclass"
+
+        self.record_type = record_type
+        # Nested batches share one table, so a string is stored once per batch tree
+        self.strings = strings if strings is not None else StringTable()
+        self._length = 0
+
+        hints = get_type_hints(record_type)
+        self._columns = []
+        for f in fields(record_type):
+            kind, item_type = self._column_kind(hints[f.name])
+            # Typed arrays cannot hold None, so those columns keep a null mask
+            # beside them and store a zero or empty list in its place
+            nulls = array("b") if kind in ("int", "float", "str_list", "record_list") else None
+            self._columns.append((f.name, kind, self._new_column(kind, item_type), nulls))
+
+    @classmethod
+    def from_records(cls, record_type: type, records: Iterable[Any]) -> "RecordBatch":
+        batch = cls(record_type)
+        batch.extend(records)
+        return batch
+
+    def _column_kind(self, tp: Any):
+        # Optional[X] is Union[X, None]
+        if get_origin(tp) is Union:
+            args = [ arg for arg in get_args(tp) if arg is not type(None) ]
+            if len(args) == 1:
+                tp = args[0]
+
+        if tp is str:
+            return "str", None
+        if tp is int:
+            return "int", None
+        if tp is float:
+            return "float", None
+        if get_origin(tp) in (list, List):
+            item_type = get_args(tp)[0]
+            if item_type is str:
+                return "str_list", None
+            if is_dataclass(item_type):
+                return "record_list", item_type
+        return "object", None
+
+    def _new_column(self, kind: str, item_type: Optional[type]):
+        if kind in ("str", "int"):
+            return array("q")
+        if kind == "float":
+            return array("d")
+        if kind == "str_list":
+            return (array("q", [ 0 ]), array("q"))
+        if kind == "record_list":
+            return (array("q", [ 0 ]), RecordBatch(item_type, strings=self.strings))
+        return []
+
+    def append(self, record: Any) -> None:
+        for name, kind, column, nulls in self._columns:
+            value = getattr(record, name)
+            if nulls is not None:
+                nulls.append(value is None)
+                if value is None:
+                    value = [] if kind in ("str_list", "record_list") else 0
+            if kind == "str":
+                column.append(self.strings.index(value))
+            elif kind == "str_list":
+                offsets, values = column
+                values.extend(self.strings.index(item) for item in value)
+                offsets.append(len(values))
+            elif kind == "record_list":
+                offsets, children = column
+                children.extend(value)
+                offsets.append(len(children))
+            else:
+                column.append(value)
+        self._length += 1
+
+    def extend(self, records: Iterable[Any]) -> None:
+        for record in records:
+            self.append(record)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> Any:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Record index out of range")
+        return self.record_type(**{ name: self._value(kind, column, nulls, index) for name, kind, column, nulls in self._columns })
+
+    def __iter__(self) -> Iterator[Any]:
+        for i in range(self._length):
+            yield self[i]
+
+    def _value(self, kind: str, column: Any, nulls: Optional[array], index: int) -> Any:
+        if nulls is not None and nulls[index]:
+            return None
+        if kind == "str":
+            return self.strings.get(column[index])
+        if kind == "str_list":
+            offsets, values = column
+            return [ self.strings.get(string_id) for string_id in values[offsets[index]:offsets[index + 1]] ]
+        if kind == "record_list":
+            offsets, children = column
+            return [ children[i] for i in range(offsets[index], offsets[index + 1]) ]
+        return column[index]
+
+    def column(self, name: str) -> List[Any]:
+        for column_name, kind, column, nulls in self._columns:
+            if column_name == name:
+                return [ self._value(kind, column, nulls, i) for i in range(self._length) ]
+        raise KeyError(name)
+
+    def to_records(self) -> List[Any]:
+        return list(self)
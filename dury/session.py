@@ -0,0 +1,65 @@
+import threading
+from typing import Dict, Optional, Any
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class SessionPool:
+    def __init__(
+        self, *,
+        pool_size: Optional[int] = 10,
+        headers: Optional[Dict[str, Any]] = None
+    ) -> None:
+        self.pool_size = pool_size
+        self.headers = headers
+        self._sessions: Dict[str, requests.Session] = {}
+        self._mounted_sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> requests.Session:
+        parsed = urlparse(url)
+        host = f"{parsed.scheme}://{parsed.netloc}"
+
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is not None and self._mounted_sizes[host] >= self.pool_size:
+                return session
+
+            # A live session may be in use by other threads, so a larger
+            # connection pool goes on a fresh session that replaces it
+            replaced = session
+            session = requests.Session()
+            if self.headers is not None:
+                session.headers.update(self.headers)
+            if replaced is not None:
+                session.cookies.update(replaced.cookies)
+            session.mount(f"{host}/", HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+            self._sessions[host] = session
+            self._mounted_sizes[host] = self.pool_size
+
+        if replaced is not None:
+            # Idle connections are dropped now, ones in use once released
+            replaced.close()
+        return session
+
+    def resize(self, pool_size: int) -> None:
+        with self._lock:
+            self.pool_size = max(self.pool_size, pool_size)
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._mounted_sizes.clear()
+
+    def __enter__(self) -> "SessionPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+default_session_pool = SessionPool()
@@ -0,0 +1,154 @@
+import csv
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import is_dataclass, asdict
+from typing import Optional, List, Dict, Any, Iterable
+
+
+class RecordSink:
+    def __init__(self, *, batch_size: Optional[int] = 100) -> None:
+        self.batch_size = batch_size
+        self.num_written = 0
+
+        self._batch: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def write(self, record: Any) -> None:
+        # Records are buffered and written in batches, so a crawl shows up on
+        # disk as it runs without paying for a write per record
+        with self._lock:
+            self._batch.append(self._to_dict(record))
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+
+    def write_many(self, records: Iterable[Any]) -> int:
+        num_records = 0
+        for record in records:
+            self.write(record)
+            num_records += 1
+        return num_records
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        self.flush()
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+        self._write_batch(self._batch)
+        self.num_written += len(self._batch)
+        self._batch = []
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def _to_dict(self, record: Any) -> Dict[str, Any]:
+        if is_dataclass(record):
+            return asdict(record)
+        return dict(record)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class JsonLinesSink(RecordSink):
+    def __init__(self, path: str, *, append: Optional[bool] = False, **kwargs) -> None:
+        super(JsonLinesSink, self).__init__(**kwargs)
+        _makedirs(path)
+        self.path = path
+        self._f = open(path, "a" if append else "w", encoding="utf-8")
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        self._f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+        self._f.flush()
+
+    def close(self) -> None:
+        super(JsonLinesSink, self).close()
+        self._f.close()
+
+
+class CsvSink(RecordSink):
+    def __init__(self, path: str, *, fieldnames: Optional[List[str]] = None, **kwargs) -> None:
+        super(CsvSink, self).__init__(**kwargs)
+        _makedirs(path)
+        self.path = path
+        self.fieldnames = fieldnames
+        self._f = open(path, "w", encoding="utf-8", newline="")
+        self._writer = None
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if self._writer is None:
+            # Columns follow the first record unless they were given
+            fieldnames = self.fieldnames or list(batch[0].keys())
+            self._writer = csv.DictWriter(self._f, fieldnames=fieldnames, extrasaction="ignore")
+            self._writer.writeheader()
+
+        self._writer.writerows({ key: _flatten(value) for key, value in record.items() } for record in batch)
+        self._f.flush()
+
+    def close(self) -> None:
+        super(CsvSink, self).close()
+        self._f.close()
+
+
+class SqliteSink(RecordSink):
+    def __init__(self, path: str, *, table: Optional[str] = "records", **kwargs) -> None:
+        super(SqliteSink, self).__init__(**kwargs)
+        _makedirs(path)
+        self.path = path
+        self.table = table
+        self._columns = None
+        self._db = sqlite3.connect(path, check_same_thread=False)
+
+    def _write_batch(self, batch: List[Dict[str, Any]]) -> None:
+        if self._columns is None:
+            self._columns = list(batch[0].keys())
+            columns = ", ".join(f'"{column}"' for column in self._columns)
+            self._db.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" ({columns})')
+
+        columns = ", ".join(f'"{column}"' for column in self._columns)
+        placeholders = ", ".join("?" for _ in self._columns)
+        with self._db:
+            self._db.executemany(
+                f'INSERT INTO "{self.table}" ({columns}) VALUES ({placeholders})',
+                [ [ _flatten(record.get(column)) for column in self._columns ] for record in batch ]
+            )
+
+    def close(self) -> None:
+        super(SqliteSink, self).close()
+        self._db.close()
+
+
+SINKS = {
+    ".jsonl": JsonLinesSink,
+    ".csv": CsvSink,
+    ".sqlite3": SqliteSink,
+    ".db": SqliteSink
+}
+
+
+def open_sink(path: str, **kwargs) -> RecordSink:
+    ext = os.path.splitext(path)[1].lower()
+    assert ext in SINKS, "Unsupported sink format"
+    return SINKS[ext](path, **kwargs)
+
+
+def _flatten(value: Any) -> Any:
+    # Lists and nested records are kept as JSON in a single column
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _makedirs(path: str) -> None:
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
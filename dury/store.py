@@ -0,0 +1,106 @@
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Optional
+
+
+class ContentStore:
+    MODES = ("hardlink", "manifest")
+
+    def __init__(
+        self,
+        root: str, *,
+        mode: Optional[str] = "hardlink",
+        algorithm: Optional[str] = "sha256"
+    ) -> None:
+        assert mode in self.MODES, "Invalid store mode"
+
+        self.root = root
+        self.mode = mode
+        self.algorithm = algorithm
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index = sqlite3.connect(
+            os.path.join(self.root, "index.sqlite3"),
+            check_same_thread=False,
+            isolation_level=None
+        )
+        self._index.execute("CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL)")
+
+    def hasher(self):
+        return hashlib.new(self.algorithm)
+
+    def hash_file(self, path: str, *, chunk_size: Optional[int] = 1024 * 1024):
+        hasher = self.hasher()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                hasher.update(chunk)
+        return hasher
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], digest[2:])
+
+    def lookup(self, url: str) -> Optional[str]:
+        with self._lock:
+            row = self._index.execute("SELECT digest FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None or not os.path.exists(self.object_path(row[0])):
+            return None
+        return row[0]
+
+    def put(self, path: str, digest: str, *, url: Optional[str] = None) -> str:
+        object_path = self.object_path(digest)
+        if os.path.exists(object_path):
+            os.remove(path)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            try:
+                os.replace(path, object_path)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # Renames do not cross devices, so the object is copied next to
+                # its final path first and only renamed into place once complete
+                tmp_path = f"{object_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                shutil.copyfile(path, tmp_path)
+                os.replace(tmp_path, object_path)
+                os.remove(path)
+
+        if url is not None:
+            with self._lock:
+                self._index.execute("INSERT OR REPLACE INTO urls (url, digest) VALUES (?, ?)", (url, digest))
+        return object_path
+
+    def materialize(self, digest: str, output_path: str, *, url: Optional[str] = None) -> str:
+        object_path = self.object_path(digest)
+
+        if self.mode == "manifest":
+            entry = { "path": output_path, "digest": digest, "url": url, "object": object_path }
+            manifest_path = os.path.join(os.path.dirname(output_path) or ".", "manifest.jsonl")
+            with self._lock:
+                with open(manifest_path, "a") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            return object_path
+
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        try:
+            os.link(object_path, output_path)
+        except OSError:
+            # Hardlinks are not available across devices
+            shutil.copyfile(object_path, output_path)
+        return output_path
+
+    def close(self) -> None:
+        with self._lock:
+            self._index.close()
+
+    def __enter__(self) -> "ContentStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -1,8 +1,22 @@
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
 import requests
-from typing import Dict, Optional
+from tqdm import tqdm
+
+from dury.metrics import Metrics, default_metrics
+from dury.session import SessionPool, default_session_pool
+from dury.store import ContentStore
 
 
 DEFAULT_HEADER =  { "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36" }
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_ENGINES = ("thread", "asyncio")
 
 
 def download(
@@ -10,16 +24,262 @@ def download(
     headers: Optional[Dict[str, str]] = DEFAULT_HEADER,
     timeout: Optional[int] = None,
     retry: Optional[int] = 5,
+    chunk_size: Optional[int] = DEFAULT_CHUNK_SIZE,
+    session_pool: Optional[SessionPool] = None,
+    store: Optional[ContentStore] = None,
+    metrics: Optional[Metrics] = None
 ):
-    res = requests.get(url, headers=headers, timeout=timeout)
-    if res.status_code == 200:
-        with open(output_path, "wb") as f:
-            f.write(res.content)
+    metrics = metrics or default_metrics
+    if store is not None:
+        digest = store.lookup(url)
+        if digest is not None:
+            metrics.inc("download_store_hits")
+            return store.materialize(digest, output_path, url=url)
+
+    # Body is streamed into a partial file which is renamed into place once
+    # complete, so an interrupted transfer is resumed with a Range request.
+    part_path = f"{output_path}.part"
+    offset, validator = resume_state(part_path, url)
+    request_headers = resume_headers(headers, offset, validator)
+
+    started = time.monotonic()
+    try:
+        session = (session_pool or default_session_pool).get(url)
+        with session.get(url, headers=request_headers, timeout=timeout, stream=True) as res:
+            metrics.inc("download_status", code=res.status_code)
+            if res.status_code == 416:
+                # Partial file is already complete or no longer matches the remote
+                os.remove(part_path)
+                raise IOError(f"Invalid range for {url}")
+            if res.status_code not in (200, 206):
+                raise IOError(f"Unexpected status code {res.status_code} for {url}")
+
+            if res.status_code == 200:
+                # Server ignored the range request or the remote changed, start over
+                offset = 0
+                save_resume_state(part_path, url, res.headers)
+
+            expected_size = get_expected_size(res.headers, offset)
+
+            hasher = None
+            if store is not None:
+                hasher = store.hash_file(part_path) if offset > 0 else store.hasher()
+
+            with open(part_path, "ab" if offset > 0 else "wb") as f:
+                for chunk in res.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    metrics.inc("download_bytes", len(chunk))
+                    if hasher is not None:
+                        hasher.update(chunk)
+
+        size = os.path.getsize(part_path)
+        if expected_size is not None and size != expected_size:
+            raise IOError(f"Incomplete download for {url} ({size}/{expected_size} bytes)")
+
+        metrics.observe("download", time.monotonic() - started)
+        if store is not None:
+            digest = hasher.hexdigest()
+            store.put(part_path, digest, url=url)
+            clear_resume_state(part_path)
+            return store.materialize(digest, output_path, url=url)
+
+        os.replace(part_path, output_path)
+        clear_resume_state(part_path)
         return output_path
-    elif retry > 0:
-        return download(url, output_path, headers=headers, timeout=timeout, retry=retry - 1)
-    else:
-        raise IOError("Failed to download")
+    except (requests.RequestException, IOError) as e:
+        if retry > 0:
+            metrics.inc("download_retries")
+            return download(
+                url, output_path,
+                headers=headers, timeout=timeout,
+                retry=retry - 1, chunk_size=chunk_size,
+                session_pool=session_pool, store=store, metrics=metrics
+            )
+        metrics.inc("download_failures")
+        raise IOError("Failed to download") from e
+
+
+def resume_state(part_path: str, url: str) -> Tuple[int, Optional[str]]:
+    # A partial file is only resumed when it is known to come from the same
+    # url and the server gave a validator to check it against with If-Range,
+    # otherwise a stale partial from another download would get a foreign tail
+    if not os.path.exists(part_path):
+        return 0, None
+
+    state = None
+    meta_path = f"{part_path}.meta"
+    if os.path.exists(meta_path):
+        try:
+            with open(meta_path, "r") as f:
+                state = json.load(f)
+        except ValueError:
+            state = None
+
+    if state is None or state.get("url") != url or state.get("validator") is None:
+        os.remove(part_path)
+        clear_resume_state(part_path)
+        return 0, None
+    return os.path.getsize(part_path), state["validator"]
+
+
+def resume_headers(headers: Optional[Dict[str, str]], offset: int, validator: Optional[str]) -> Dict[str, str]:
+    request_headers = dict(headers or {})
+    if offset > 0:
+        request_headers["Range"] = f"bytes={offset}-"
+        request_headers["If-Range"] = validator
+    return request_headers
+
+
+def save_resume_state(part_path: str, url: str, response_headers: Dict[str, str]) -> None:
+    # Weak ETags are not allowed in If-Range
+    validator = response_headers.get("ETag")
+    if validator is None or validator.startswith("W/"):
+        validator = response_headers.get("Last-Modified")
+
+    with open(f"{part_path}.meta", "w") as f:
+        json.dump({ "url": url, "validator": validator }, f)
+
+
+def clear_resume_state(part_path: str) -> None:
+    meta_path = f"{part_path}.meta"
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+
+def fetch(
+    url: str, *,
+    headers: Optional[Dict[str, str]] = DEFAULT_HEADER,
+    timeout: Optional[int] = None,
+    retry: Optional[int] = 5,
+    session_pool: Optional[SessionPool] = None
+) -> bytes:
+    try:
+        session = (session_pool or default_session_pool).get(url)
+        res = session.get(url, headers=headers, timeout=timeout)
+        if res.status_code != 200:
+            raise IOError(f"Unexpected status code {res.status_code} for {url}")
+
+        expected_size = get_expected_size(res.headers, 0)
+        if expected_size is not None and len(res.content) != expected_size:
+            raise IOError(f"Incomplete download for {url} ({len(res.content)}/{expected_size} bytes)")
+        return res.content
+    except (requests.RequestException, IOError) as e:
+        if retry > 0:
+            return fetch(url, headers=headers, timeout=timeout, retry=retry - 1, session_pool=session_pool)
+        raise IOError("Failed to download") from e
+
+
+def append_file(dst_fd: int, src_path: str) -> None:
+    # Let the kernel move the bytes instead of reading them through userspace
+    with open(src_path, "rb") as src:
+        src_fd = src.fileno()
+        size = os.fstat(src_fd).st_size
+        copied = 0
+
+        if hasattr(os, "copy_file_range"):
+            try:
+                while copied < size:
+                    n = os.copy_file_range(src_fd, dst_fd, size - copied)
+                    if n == 0:
+                        break
+                    copied += n
+                return
+            except OSError:
+                pass
+
+        if hasattr(os, "sendfile"):
+            try:
+                while copied < size:
+                    n = os.sendfile(dst_fd, src_fd, copied, size - copied)
+                    if n == 0:
+                        break
+                    copied += n
+                return
+            except OSError:
+                pass
+
+        src.seek(copied)
+        with open(dst_fd, "ab", closefd=False) as dst:
+            shutil.copyfileobj(src, dst)
+
+
+class OrderedWriter:
+    def __init__(self, f: BinaryIO, *, buffer_size: Optional[int] = 16) -> None:
+        self._f = f
+        self.buffer_size = buffer_size
+        self._next_index = 0
+        self._pending: Dict[int, bytes] = {}
+        self._aborted = False
+        self._cond = threading.Condition()
+
+    def reserve(self, index: int) -> None:
+        # Block workers that run too far ahead so at most buffer_size
+        # out-of-order pieces are held in memory
+        with self._cond:
+            self._cond.wait_for(lambda: self._aborted or index < self._next_index + self.buffer_size)
+            if self._aborted:
+                raise IOError("Writer was aborted")
+
+    def abort(self) -> None:
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+    def write(self, index: int, data: bytes) -> None:
+        with self._cond:
+            self._pending[index] = data
+            while self._next_index in self._pending:
+                self._f.write(self._pending.pop(self._next_index))
+                self._next_index += 1
+            self._cond.notify_all()
+
+    @property
+    def written(self) -> int:
+        return self._next_index
+
+
+def get_expected_size(headers: Dict[str, str], offset: int) -> Optional[int]:
+    # Content-Length describes the encoded body, which iter_content decodes
+    content_length = headers.get("Content-Length")
+    if content_length is None or headers.get("Content-Encoding", "identity") != "identity":
+        return None
+    return offset + int(content_length)
+
+
+def download_many(
+    tasks: List[Tuple[str, str]], *,
+    engine: Optional[str] = "thread",
+    num_workers: Optional[int] = 10,
+    headers: Optional[Dict[str, str]] = DEFAULT_HEADER,
+    timeout: Optional[int] = None,
+    retry: Optional[int] = 5,
+    session_pool: Optional[SessionPool] = None,
+    store: Optional[ContentStore] = None,
+    metrics: Optional[Metrics] = None
+) -> List[str]:
+    assert engine in DOWNLOAD_ENGINES, "Invalid download engine"
+
+    if engine == "asyncio":
+        # The asyncio engine pools connections in its own aiohttp session,
+        # so a session pool given for the thread engine is left unused
+        from dury.aio import download_all
+        return download_all(
+            tasks,
+            num_workers=num_workers, headers=headers,
+            timeout=timeout, retry=retry, store=store, metrics=metrics
+        )
+
+    if session_pool is not None:
+        session_pool.resize(num_workers)
+    task = lambda x: download(
+        x[0], x[1],
+        headers=headers, timeout=timeout,
+        retry=retry, session_pool=session_pool, store=store, metrics=metrics
+    )
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        results = list(tqdm(executor.map(task, tasks), total=len(tasks)))
+    return results
 
 
 def get_extension(path: str):
@@ -9,4 +9,7 @@ setup(
     author_email="schyun9212@gmail.com",
     description="",
     packages=find_packages(),
+    extras_require={
+        "asyncio": ["aiohttp"],
+    },
 )
\ No newline at end of file